@@ -1,12 +1,15 @@
 #! /usr/bin/env python3
 
 # External dependencies
-import asyncio, curses, re, socket
+import asyncio, curses, itertools, re, socket, sys
+from collections import deque
 
 # Multicast addresses and port
 MULTICAST_ADDRESS4 = '239.0.0.1'
 MULTICAST_ADDRESS6 = 'FF02::239:0:0:1'
 MULTICAST_PORT = 10000
+# Maximum number of messages kept in the chat history
+HISTORY_SIZE = 1000
 
 # Chat server protocol
 class ChatProtocol :
@@ -36,9 +39,14 @@ class ChatApp :
 		# Initialize curses
 		self.screen = curses.initscr()
 		curses.cbreak()
+		curses.noecho()
 		self.screen.keypad( 1 )
-		# Received messages
-		self.messages = []
+		# Received messages (the oldest ones are removed)
+		self.messages = deque( maxlen = HISTORY_SIZE )
+		# Number of messages under the visible ones (scroll-back)
+		self.scroll = 0
+		# Message being typed
+		self.text = ''
 		# Setup the screen interface
 		self.SetupInterface()
 		# Start the main loop
@@ -46,6 +54,7 @@ class ChatApp :
 		except : pass
 		finally :
 			# Stop curses
+			curses.echo()
 			curses.nocbreak()
 			self.screen.keypad(0)
 			self.screen = None
@@ -57,11 +66,10 @@ class ChatApp :
 		await loop.create_datagram_endpoint( lambda : ChatProtocol(self.ReceiveMessage), local_addr = ( '::', MULTICAST_PORT ) )
 		# Create the client
 		self.client = socket.socket( socket.AF_INET6, socket.SOCK_DGRAM )
-		# Run the input main loop
-		while True:
-			asyncio.run_coroutine_threadsafe( self.InputMessage(), loop = loop )
-			# Wait a moment (curses issue)
-			await asyncio.sleep(0.1)
+		# Read the keys when they are typed
+		loop.add_reader( sys.stdin, self.InputKeys )
+		# Run until stopped (Ctrl+C)
+		await loop.create_future()
 	# Setup the console interface
 	def SetupInterface( self ) :
 		# Application title
@@ -75,46 +83,97 @@ class ChatApp :
 		# Title window
 		self.title = curses.newwin( title_height, screen_width - 2, 0, 1 )
 		self.title.addstr( 1, int( ( screen_width - len( APP_TITLE ) ) / 2 ), APP_TITLE, curses.A_BOLD )
-		self.title.refresh()
+		self.title.noutrefresh()
 		# History window
 		self.history = curses.newwin( history_height, screen_width - 2, title_height, 1 )
 		# Save the number of visible rows (history window height - border - padding ) 
 		self.history_visible_rows = history_height - 2 - 2
-		self.history.border( 0 )
-		self.history.addstr( 0, 2, ' Message received ', curses.A_BOLD )
-		self.history.refresh()
-		# Prompt window
+		self.DrawTitle()
+		# Messages of the history window (inside the border and the padding), scrolled by curses for the new messages
+		self.history_text = self.history.derwin( self.history_visible_rows, screen_width - 2 - 6, 2, 3 )
+		self.history_text.scrollok( 1 )
+		self.history_text.idlok( 1 )
+		# Prompt window, read without blocking
 		self.prompt = curses.newwin( prompt_height, screen_width - 2, screen_height - prompt_height - 1, 1 )
+		self.prompt.keypad( 1 )
+		self.prompt.nodelay( 1 )
 		self.prompt.border( 0 )
 		self.prompt.addstr( 0, 2, ' Send a message ', curses.A_BOLD )
 		self.prompt.addstr( 2, 2, ' > ', curses.A_BOLD )
-		self.prompt.refresh()
-	async def InputMessage( self ) :
-		message = self.prompt.getstr()
-		if message == curses.KEY_F1 :
-			message = 'F1'
-		if message :
-			self.client.sendto( message, ( f'::ffff:{MULTICAST_ADDRESS4}', MULTICAST_PORT ) )
-#		self.client.sendto( message, ( MULTICAST_ADDRESS6, MULTICAST_PORT ) )
-		# Refresh the prompt
-		self.prompt.clear()
-		self.prompt.border( 0 )
-		self.prompt.addstr( 0, 2, ' Send a message ', curses.A_BOLD )
-		self.prompt.addstr( 2, 2, ' > ', curses.A_BOLD )
-		self.prompt.refresh()
+		self.prompt.noutrefresh()
+		# Update the screen once
+		curses.doupdate()
+	# Read the typed keys (stdin is ready)
+	def InputKeys( self ) :
+		while True :
+			# Get the next key, until there is no more input
+			try : key = self.prompt.get_wch()
+			except curses.error : break
+			# Send the message
+			if key in ( '\n', '\r', curses.KEY_ENTER ) :
+				if self.text :
+					self.client.sendto( self.text.encode(), ( f'::ffff:{MULTICAST_ADDRESS4}', MULTICAST_PORT ) )
+#					self.client.sendto( self.text.encode(), ( MULTICAST_ADDRESS6, MULTICAST_PORT ) )
+				self.text = ''
+			# Remove the last character
+			elif key in ( curses.KEY_BACKSPACE, '\x7f', '\b' ) : self.text = self.text[ : -1 ]
+			# Scroll back the history by one page
+			elif key == curses.KEY_PPAGE :
+				self.scroll = min( self.scroll + self.history_visible_rows, max( len( self.messages ) - self.history_visible_rows, 0 ) )
+				self.DrawHistory()
+			# Scroll forward the history by one page
+			elif key == curses.KEY_NPAGE :
+				self.scroll = max( self.scroll - self.history_visible_rows, 0 )
+				self.DrawHistory()
+			# Add a character to the message
+			elif isinstance( key, str ) and key.isprintable() : self.text += key
+		# Draw the message being typed (its end if it is too long), with the cursor after it
+		width = self.prompt.getmaxyx()[1] - 7
+		self.prompt.addstr( 2, 5, self.text[ -width : ].ljust( width ) )
+		self.prompt.move( 2, 5 + len( self.text[ -width : ] ) )
+		self.prompt.noutrefresh()
+		curses.doupdate()
+	# Draw the border and the title of the history window, with the scroll-back position
+	def DrawTitle( self ) :
+		self.history.border( 0 )
+		self.history.addstr( 0, 2, ' Message received ' + ( f'( {self.scroll} more below ) ' if self.scroll else '' ), curses.A_BOLD )
+		self.history.noutrefresh()
+	# Draw a message on a row of the history
+	def DrawMessage( self, row, message, address ) :
+		# Keep the last column free, to avoid scrolling the history
+		width = self.history_text.getmaxyx()[1] - 1
+		self.history_text.move( row, 0 )
+		self.history_text.clrtoeol()
+		self.history_text.addnstr( f'{address} > ', width, curses.A_BOLD )
+		if width > len( address ) + 3 : self.history_text.addnstr( message, width - len( address ) - 3 )
+	# Draw all the visible messages (scroll-back)
+	def DrawHistory( self ) :
+		self.DrawTitle()
+		self.history_text.erase()
+		end = len( self.messages ) - self.scroll
+		for row, ( message, address ) in enumerate( itertools.islice( self.messages, max( end - self.history_visible_rows, 0 ), end ) ) :
+			self.DrawMessage( row, message, address )
+		self.history_text.noutrefresh()
+		self.prompt.noutrefresh()
 	# Append a message to the chat history
 	def ReceiveMessage( self, message, address ) :
-		self.messages.append( ( message, address ) )
-		# Draw the last N messages, where N is the number of visible rows
-		row = 2
-		for message, address in self.messages[ -self.history_visible_rows : ] :
-			self.history.move( row, 3 )
-			self.history.clrtoeol()
-			self.history.addstr( f'{address} > ', curses.A_BOLD )
-			self.history.addstr( message )
-			row += 1
-		self.history.refresh()
-		self.prompt.refresh()
+		self.messages.append( ( message.decode( errors = 'replace' ), address ) )
+		# Scrolled back, keep the visible messages if they are still in the history
+		if self.scroll :
+			if self.scroll < len( self.messages ) - self.history_visible_rows :
+				self.scroll += 1
+				self.DrawTitle()
+			else : self.DrawHistory()
+			return curses.doupdate()
+		# Draw only the new message, under the previous ones (the history is scrolled if it is full)
+		row = len( self.messages ) - 1
+		if row >= self.history_visible_rows :
+			self.history_text.scroll()
+			row = self.history_visible_rows - 1
+		self.DrawMessage( row, *self.messages[ -1 ] )
+		self.history_text.noutrefresh()
+		self.prompt.noutrefresh()
+		curses.doupdate()
 	
 # Main application
 if __name__ == '__main__' :
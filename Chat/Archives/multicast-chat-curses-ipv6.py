@@ -12,10 +12,13 @@ import curses
 import socket
 import threading
 import time
+from collections import deque
 
 # Multicast address and port
 MULTICAST_ADDRESS = 'FF08::1'
 MULTICAST_PORT = 10000
+# Maximum number of messages kept in the chat history
+HISTORY_SIZE = 1000
 
 # Application title
 APP_TITLE = 'RT Auxerre Multicast Chat'
@@ -44,8 +47,8 @@ class ChatApp :
 		self.screen = curses.initscr()
 		curses.cbreak()
 		self.screen.keypad( 1 )
-		# Received messages
-		self.messages = []
+		# Received messages (the oldest ones are removed)
+		self.messages = deque( maxlen=HISTORY_SIZE )
 		# Setup the screen interface
 		self.SetupInterface()
 		# Start the server thread to receive messages
@@ -95,25 +98,28 @@ class ChatApp :
 		# Refresh the screen
 		self.screen.erase()
 		# Refresh the title
-		self.title.refresh()
+		self.title.noutrefresh()
 		# Refresh the chat history
 		self.history.erase()
 		self.history.border( 0 )
 		self.history.addstr( 0, 1, ' Message received ', curses.A_BOLD )
-		# Draw the last N messages, where N is the number of visible rows
+		# Draw the last N messages, where N is the number of visible rows (copy the history appended by the receiving thread)
 		row = 2
-		for address, message in self.messages[ -self.history_visible_rows : ] :
+		messages = list( self.messages )
+		for address, message in messages[ max( len( messages ) - self.history_visible_rows, 0 ) : ] :
 			self.history.move( row, 3 )
 			self.history.addstr( '{} > '.format( address ), curses.A_BOLD )
 			self.history.addstr( message )
 			row += 1
-		self.history.refresh()
+		self.history.noutrefresh()
 		# Refresh the prompt
 		self.prompt.erase()
 		self.prompt.border( 0 )
 		self.prompt.addstr( 0, 1, ' Send a message ', curses.A_BOLD )
 		self.prompt.addstr( 2, 2, ' > ', curses.A_BOLD )
-		self.prompt.refresh()
+		self.prompt.noutrefresh()
+		# Update the screen once
+		curses.doupdate()
 	# Append a message to the chat history
 	def ReceiveMessage( self, msg ) :
 		self.messages.append( msg )
@@ -0,0 +1,264 @@
+#! /usr/bin/env python
+
+#
+# Multicast Chat Benchmark (flood sender and headless receiver)
+# https://github.com/microy/RT-Auxerre
+# Copyright (c) 2026 Michaël Roy
+# usage : $ ./chat-bench.py --receive
+#         $ ./chat-bench.py --rate 10000 --processes 4
+#
+
+# External dependencies
+import argparse
+import asyncio
+import bisect
+import multiprocessing
+import os
+import socket
+import time
+
+# Multicast addresses and port
+MULTICAST_ADDRESS4 = '239.0.0.1'
+MULTICAST_ADDRESS6 = 'FF02::239:0:0:1'
+MULTICAST_PORT = 10000
+# Number of messages per second, all the senders together (0 for no limit)
+RATE = 1000
+# Message size in bytes
+SIZE = 64
+# Number of sender processes
+PROCESSES = 1
+# Test duration
+DURATION = 10
+# Socket buffer sizes in bytes (0 for the system default)
+RECEIVE_BUFFER = 4 * 1024 * 1024
+SEND_BUFFER = 0
+# Maximum number of datagrams read at each wakeup of the event loop
+BATCH_SIZE = 256
+# Maximum gap between the sequence numbers received from one sender (a larger one is not a benchmark message)
+SEQUENCE_GAP = 1000000
+# Upper bounds of the latency histogram in microseconds (16 µs to 1 s)
+LATENCY_BOUNDS = [ 2 ** i for i in range( 4, 21 ) ]
+
+# Benchmark message : tag, run identifier, sender number, sequence number, send time (ns), padding
+# The messages are text, so they can be shown by the chat applications
+def bench_message( run, sender, sequence, size ) :
+	message = f'bench {run} {sender} {sequence} {time.time_ns()} '.encode()
+	return message + b'.' * ( size - len( message ) )
+
+# Set the size of a socket buffer (0 for the system default), return the size given by the kernel
+# Without root, the size is limited by the system (sysctl net.core.rmem_max and net.core.wmem_max)
+def set_buffer( sock, option, size ) :
+	if size : sock.setsockopt( socket.SOL_SOCKET, option, size )
+	return sock.getsockopt( socket.SOL_SOCKET, option )
+
+# Number of datagrams dropped by the kernel for a socket (receive buffer full), None if not available (Linux only)
+def kernel_drops( sock ) :
+	inode = str( os.fstat( sock.fileno() ).st_ino )
+	try :
+		with open( '/proc/net/udp6' ) as file :
+			for line in file :
+				fields = line.split()
+				if fields[9] == inode : return int( fields[-1] )
+	except ( OSError, IndexError, ValueError ) : pass
+	return None
+
+# Chat server, reading the datagrams from a non-blocking socket
+# All the waiting datagrams are read at each wakeup of the event loop, and sent to the application as a list
+class ChatServer :
+	# Initialisation
+	def __init__( self, messages_callback ) :
+		# Register the messages callback from the application
+		self.messages_callback = messages_callback
+		# Create the socket, with the receive buffer size
+		self.socket = socket.socket( socket.AF_INET6, socket.SOCK_DGRAM )
+		self.socket.setblocking( False )
+		set_buffer( self.socket, socket.SO_RCVBUF, RECEIVE_BUFFER )
+		self.socket.bind( ( '::', MULTICAST_PORT ) )
+		# Register the IPv4 multicast group
+		self.socket.setsockopt( socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+			socket.inet_aton( MULTICAST_ADDRESS4 ) + socket.inet_aton( '0.0.0.0' ) )
+		# Register the IPv6 multicast group
+		self.socket.setsockopt( socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP,
+			socket.inet_pton( socket.AF_INET6, MULTICAST_ADDRESS6 ) + socket.inet_pton( socket.AF_INET6, '::' ) )
+		# Read the datagrams from the event loop
+		asyncio.get_running_loop().add_reader( self.socket, self.receive )
+	# Messages reception
+	def receive( self ) :
+		messages = []
+		# Read the waiting datagrams
+		while len( messages ) < BATCH_SIZE :
+			try : message, address = self.socket.recvfrom( 65535 )
+			except OSError : break
+			# Cleanup the address
+			messages.append( ( message, address[0].removeprefix( '::ffff:' ) ) )
+		# Send the messages to the application
+		if messages : self.messages_callback( messages )
+
+# Send the messages of one sender process, return the number of messages sent and the number of errors
+def sender( run, number, rate, size, send_buffer, duration, address ) :
+	sent = errors = 0
+	with socket.socket( socket.AF_INET6, socket.SOCK_DGRAM ) as client :
+		set_buffer( client, socket.SO_SNDBUF, send_buffer )
+		start_time = time.perf_counter()
+		while ( elapsed := time.perf_counter() - start_time ) < duration :
+			# Send the messages due at this time (a burst of messages without rate limit)
+			# The sequence numbers count the messages sent, so the send errors are not reported as losses by the receiver
+			due = int( elapsed * rate ) + 1 if rate else sent + errors + 100
+			while sent + errors < due :
+				try :
+					client.sendto( bench_message( run, number, sent, size ), address )
+					sent += 1
+				# Kernel send buffer full
+				except OSError : errors += 1
+			# Wait for the next message
+			if rate : time.sleep( max( ( sent + errors ) / rate - ( time.perf_counter() - start_time ), 0 ) )
+	return sent, errors
+
+# Flood the chat with several sender processes
+def send( ipv6 ) :
+	address = ( MULTICAST_ADDRESS6, MULTICAST_PORT ) if ipv6 else ( f'::ffff:{MULTICAST_ADDRESS4}', MULTICAST_PORT )
+	print( f'\nIUT RT Auxerre - Multicast Chat Benchmark ( {PROCESSES} senders, {f'{RATE} messages/s' if RATE else 'no rate limit'}, '
+		f'{SIZE} bytes, {DURATION} s, {'IPv6' if ipv6 else 'IPv4'} )\n' )
+	# Run the senders, with a share of the rate each
+	start_time = time.perf_counter()
+	with multiprocessing.Pool( PROCESSES ) as pool :
+		results = pool.starmap( sender, [ ( os.getpid(), number, RATE / PROCESSES, SIZE, SEND_BUFFER, DURATION, address ) for number in range( PROCESSES ) ] )
+	duration = time.perf_counter() - start_time
+	# Print the results
+	print( '  -- Sender --  -- Messages --  -- Errors --  -- Messages/s --\n' )
+	for number, ( sent, errors ) in enumerate( results ) :
+		print( f'  {number:^12}  {sent:14}  {errors:12}  {sent / duration:16.1f}' )
+	sent, errors = sum( result[0] for result in results ), sum( result[1] for result in results )
+	print( f'\n  {'Total':^12}  {sent:14}  {errors:12}  {sent / duration:16.1f}\n' )
+
+# Statistics of the messages of one sender
+class Stream :
+	# Initialisation
+	def __init__( self ) :
+		self.received = 0
+		self.duplicates = 0
+		self.reordered = 0
+		# Highest sequence number received
+		self.highest = -1
+		# Received sequence numbers (one bit per message)
+		self.seen = bytearray()
+	# Add a received message
+	def add( self, sequence ) :
+		self.received += 1
+		# Grow the received sequence numbers
+		index, bit = sequence >> 3, 1 << ( sequence & 7 )
+		if index >= len( self.seen ) : self.seen.extend( bytes( max( index + 1 - len( self.seen ), 4096 ) ) )
+		# Duplicated message
+		if self.seen[index] & bit :
+			self.duplicates += 1
+			return
+		self.seen[index] |= bit
+		# Message received after a later one
+		if sequence < self.highest : self.reordered += 1
+		else : self.highest = sequence
+	# Number of lost messages (the messages after the last received one are not counted)
+	def lost( self ) :
+		return self.highest + 1 - ( self.received - self.duplicates )
+
+# Headless chat receiver, measuring the benchmark messages
+class BenchReceiver :
+	# Initialisation
+	def __init__( self ) :
+		# Statistics by run and sender
+		self.streams = {}
+		# Number of messages received, and other chat messages
+		self.received = 0
+		self.others = 0
+		# One-way latency histogram
+		self.latencies = [ 0 ] * ( len( LATENCY_BOUNDS ) + 1 )
+		# Chat server, and number of messages dropped by the kernel
+		self.server = None
+		self.kernel_drops = 0
+	# Messages reception (one batch)
+	def receive( self, messages ) :
+		receive_time = time.time_ns()
+		self.received += len( messages )
+		for message, _ in messages :
+			# Get the benchmark fields
+			fields = message.split( maxsplit = 5 )
+			try :
+				if fields[0] != b'bench' : raise ValueError
+				run, sender, sequence, send_time = int( fields[1] ), int( fields[2] ), int( fields[3] ), int( fields[4] )
+				# Check the sequence number, which sizes the received sequence numbers of the sender
+				stream = self.streams.get( ( run, sender ) )
+				if not 0 <= sequence <= ( stream.highest if stream else -1 ) + SEQUENCE_GAP : raise ValueError
+			# Other chat message
+			except ( ValueError, IndexError ) :
+				self.others += 1
+				continue
+			# Save the sequence number and the latency
+			if not stream : stream = self.streams[ ( run, sender ) ] = Stream()
+			stream.add( sequence )
+			self.latencies[ bisect.bisect_left( LATENCY_BOUNDS, ( receive_time - send_time ) / 1000 ) ] += 1
+	# Latency percentile, as the upper bound of its histogram bucket (microseconds)
+	def percentile( self, percent ) :
+		total, count = sum( self.latencies ), 0
+		for bound, latency in zip( LATENCY_BOUNDS + [ float( 'inf' ) ], self.latencies ) :
+			count += latency
+			if count >= total * percent / 100 : return bound
+	# Print the results
+	def report( self ) :
+		print( '\n\n  -- Sender --  -- Received --  -- Lost --  -- Loss --  -- Reordered --  -- Duplicates --\n' )
+		for ( run, sender ), stream in sorted( self.streams.items() ) :
+			expected = stream.highest + 1
+			print( f'  {f'{run}/{sender}':^12}  {stream.received:14}  {stream.lost():10}  {100 * stream.lost() / expected:8.2f} %'
+				f'  {stream.reordered:15}  {stream.duplicates:16}' )
+		if self.others : print( f'\n  Other chat messages : {self.others}' )
+		if self.server : print( f'\n  Dropped by the kernel : {self.kernel_drops} ( receive buffer {set_buffer( self.server.socket, socket.SO_RCVBUF, 0 )} bytes )' )
+		if not any( self.latencies ) : return print()
+		# Print the latency histogram
+		print( '\n  -- One-way latency ( the clocks of the hosts must be synchronised ) --\n' )
+		lower = 0
+		for bound, latency in zip( LATENCY_BOUNDS + [ None ], self.latencies ) :
+			if latency :
+				name = f'{lower} - {bound} µs' if bound else f'> {lower} µs'
+				print( f'  {name:>20}  {latency:10}  {'#' * max( 1, 50 * latency // max( self.latencies ) )}' )
+			lower = bound
+		print( f'\n  p50 < {self.percentile( 50 )} µs, p90 < {self.percentile( 90 )} µs, p99 < {self.percentile( 99 )} µs\n' )
+
+# Receive the messages, and print the reception rate every second
+async def receive( receiver ) :
+	receiver.server = ChatServer( receiver.receive )
+	print( f'\nIUT RT Auxerre - Multicast Chat Benchmark ( receiver on port {MULTICAST_PORT} )\nPress Ctrl+C to stop and print the results...\n' )
+	while True :
+		received = receiver.received
+		await asyncio.sleep( 1 )
+		receiver.kernel_drops = kernel_drops( receiver.server.socket ) or 0
+		print( f'\r  {receiver.received - received:10} messages/s  {receiver.received:12} messages  {receiver.kernel_drops:12} dropped by the kernel', end = '', flush = True )
+
+# Main application
+if __name__ == '__main__' :
+	# Command line parameters
+	parser = argparse.ArgumentParser( description='Multicast Chat Benchmark', formatter_class=argparse.ArgumentDefaultsHelpFormatter )
+	parser.add_argument( '--receive', action='store_true', help='Run the headless receiver, instead of the senders' )
+	parser.add_argument( '-r', '--rate', type=int, default=RATE, help='Number of messages per second, all the senders together (0 for no limit)' )
+	parser.add_argument( '-s', '--size', type=int, default=SIZE, help='Message size in bytes' )
+	parser.add_argument( '-p', '--processes', type=int, default=PROCESSES, help='Number of sender processes' )
+	parser.add_argument( '-d', '--duration', type=int, default=DURATION, help='Test duration' )
+	parser.add_argument( '-6', '--ipv6', action='store_true', help='Send the messages via IPv6' )
+	parser.add_argument( '--rcvbuf', type=int, default=RECEIVE_BUFFER, help='Socket receive buffer size (0 for the system default)' )
+	parser.add_argument( '--sndbuf', type=int, default=SEND_BUFFER, help='Socket send buffer size (0 for the system default)' )
+	args = parser.parse_args()
+	# Get the test parameters
+	RATE = args.rate
+	SIZE = args.size
+	PROCESSES = args.processes
+	DURATION = args.duration
+	# Get socket buffer sizes
+	RECEIVE_BUFFER = args.rcvbuf
+	SEND_BUFFER = args.sndbuf
+	# Run the receiver until Ctrl+C
+	if args.receive :
+		receiver = BenchReceiver()
+		try : asyncio.run( receive( receiver ) )
+		except KeyboardInterrupt : receiver.report()
+	# Run the senders
+	else :
+		try : send( args.ipv6 )
+		# Ctrl+C to stop the application
+		except KeyboardInterrupt : print( '\n' )
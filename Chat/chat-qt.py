@@ -7,15 +7,19 @@
 #
 
 # External dependencies
+import argparse
 import asyncio
 import base64
+import binascii
 import logging
-import re
+import os
+import queue
 import socket
 import sys
 import threading
 try:
-	from PySide6.QtGui import Qt, QKeySequence, QShortcut
+	from PySide6.QtCore import QTimer
+	from PySide6.QtGui import Qt, QKeySequence, QShortcut, QTextCursor
 	from PySide6.QtWidgets import QApplication, QCheckBox, QHBoxLayout, QLabel, QLineEdit, QRadioButton, QTextEdit, QVBoxLayout, QWidget
 except ImportError as error: print( error ); exit()
 
@@ -23,31 +27,70 @@ except ImportError as error: print( error ); exit()
 MULTICAST_ADDRESS4 = '239.0.0.1'
 MULTICAST_ADDRESS6 = 'FF02::239:0:0:1'
 MULTICAST_PORT = 10000
+# Socket buffer sizes in bytes (0 for the system default)
+RECEIVE_BUFFER = 4 * 1024 * 1024
+SEND_BUFFER = 0
+# Maximum number of datagrams read at each wakeup of the event loop
+BATCH_SIZE = 256
+# Maximum number of received messages waiting for display (the next ones are dropped)
+QUEUE_SIZE = 10000
+# Display interval of the received messages (milliseconds)
+DISPLAY_INTERVAL = 50
+# Maximum number of messages kept in the chat history
+HISTORY_SIZE = 10000
 
 # Logging
 logger = logging.getLogger()
 logging.basicConfig( filename='/tmp/chat.log', level=logging.INFO, format='[ %(asctime)s ] ( %(module)s ) %(message)s' )
 
-# Chat server protocol
-class ChatProtocol :
+# Set the size of a socket buffer (0 for the system default), return the size given by the kernel
+# Without root, the size is limited by the system (sysctl net.core.rmem_max and net.core.wmem_max)
+def set_buffer( sock, option, size ) :
+	if size : sock.setsockopt( socket.SOL_SOCKET, option, size )
+	return sock.getsockopt( socket.SOL_SOCKET, option )
+
+# Number of datagrams dropped by the kernel for a socket (receive buffer full), None if not available (Linux only)
+def kernel_drops( sock ) :
+	inode = str( os.fstat( sock.fileno() ).st_ino )
+	try :
+		with open( '/proc/net/udp6' ) as file :
+			for line in file :
+				fields = line.split()
+				if fields[9] == inode : return int( fields[-1] )
+	except ( OSError, IndexError, ValueError ) : pass
+	return None
+
+# Chat server, reading the datagrams from a non-blocking socket
+# All the waiting datagrams are read at each wakeup of the event loop, and sent to the application as a list
+class ChatServer :
 	# Initialisation
-	def __init__( self, message_callback ) :
-		# Register the message callback from the application
-		self.message_callback = message_callback
-	# Socket initialisation
-	def connection_made( self, transport ) :
+	def __init__( self, messages_callback ) :
+		# Register the messages callback from the application
+		self.messages_callback = messages_callback
+		# Create the socket, with the receive buffer size
+		self.socket = socket.socket( socket.AF_INET6, socket.SOCK_DGRAM )
+		self.socket.setblocking( False )
+		set_buffer( self.socket, socket.SO_RCVBUF, RECEIVE_BUFFER )
+		self.socket.bind( ( '::', MULTICAST_PORT ) )
 		# Register the IPv4 multicast group
-		transport.get_extra_info( 'socket' ).setsockopt( socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+		self.socket.setsockopt( socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
 			socket.inet_aton( MULTICAST_ADDRESS4 ) + socket.inet_aton( '0.0.0.0' ) )
 		# Register the IPv6 multicast group
-		transport.get_extra_info( 'socket' ).setsockopt( socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP,
+		self.socket.setsockopt( socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP,
 			socket.inet_pton( socket.AF_INET6, MULTICAST_ADDRESS6 ) + socket.inet_pton( socket.AF_INET6, '::' ) )
-	# Message reception
-	def datagram_received( self, message, address ) :
-		# Cleanup the address
-		address = re.sub( r'^::ffff:', '', address[0] )
-		# Send the message to the application
-		self.message_callback( message, address )
+		# Read the datagrams from the event loop
+		asyncio.get_running_loop().add_reader( self.socket, self.receive )
+	# Messages reception
+	def receive( self ) :
+		messages = []
+		# Read the waiting datagrams
+		while len( messages ) < BATCH_SIZE :
+			try : message, address = self.socket.recvfrom( 65535 )
+			except OSError : break
+			# Cleanup the address
+			messages.append( ( message, address[0].removeprefix( '::ffff:' ) ) )
+		# Send the messages to the application
+		if messages : self.messages_callback( messages )
 
 # Multicast Chat using Qt
 class MulticastChat( QWidget ) :
@@ -65,10 +108,13 @@ class MulticastChat( QWidget ) :
 		# Text edit to show the received messages
 		self.chat = QTextEdit()
 		self.chat.setFocusPolicy( Qt.NoFocus )
+		# Limit the chat history, the oldest messages are removed
+		self.chat.document().setMaximumBlockCount( HISTORY_SIZE )
 		# Application vertical layout
 		self.layout = QVBoxLayout( self )
 		# Text box for the message received
-		self.layout.addWidget( QLabel( 'Message received :' ) )
+		self.received_label = QLabel( 'Message received :' )
+		self.layout.addWidget( self.received_label )
 		self.layout.addWidget( self.chat )
 		# Input + options
 		protocols = QHBoxLayout()
@@ -89,6 +135,18 @@ class MulticastChat( QWidget ) :
 		self.message.setFocus()
 		# Client connection to send messages
 		self.client = socket.socket( socket.AF_INET6, socket.SOCK_DGRAM )
+		set_buffer( self.client, socket.SO_SNDBUF, SEND_BUFFER )
+		# Received messages, queued by the server thread and displayed in batches by the GUI thread, and number of dropped messages
+		self.received = queue.Queue( QUEUE_SIZE )
+		self.dropped = 0
+		self.timer = QTimer( self )
+		self.timer.timeout.connect( self.DisplayMessages )
+		self.timer.start( DISPLAY_INTERVAL )
+		# Show the dropped messages every second
+		self.server = None
+		self.drops_timer = QTimer( self )
+		self.drops_timer.timeout.connect( self.ShowDrops )
+		self.drops_timer.start( 1000 )
 		# Run asyncio loop in another thread
 		loop = asyncio.new_event_loop()
 		asyncio.set_event_loop( loop )
@@ -97,8 +155,7 @@ class MulticastChat( QWidget ) :
 		asyncio.run_coroutine_threadsafe( self.RunServer(), loop = loop )
 	# Run server
 	async def RunServer( self ) :
-		await asyncio.get_running_loop().create_datagram_endpoint(
-			lambda : ChatProtocol( self.ReceiveMessage ), local_addr = ( '::', MULTICAST_PORT ) )
+		self.server = ChatServer( self.ReceiveMessages )
 	# Send a message
 	def SendMessage( self ) :
 		# Return if the message is empty
@@ -112,19 +169,56 @@ class MulticastChat( QWidget ) :
 		else : self.client.sendto( message, ( MULTICAST_ADDRESS6, MULTICAST_PORT ) )
 		# Clear the text input widget
 		self.message.clear()
-	# Receive a message
-	def ReceiveMessage( self, message, address ) :
-		# Decode the message
-		if self.secret.isChecked() : message = base64.b64decode( message )
-		message = message.decode()
-		# Append the message to the chat history
-		self.chat.append( f'<b>{address} ></b> {message}' )
-		# Log the message
-		logger.info( f'{address} > {message}' )
+	# Receive the messages (server thread), queued for display
+	def ReceiveMessages( self, messages ) :
+		for message in messages :
+			try : self.received.put_nowait( message )
+			# Drop the message if the queue is full
+			except queue.Full : self.dropped += 1
+	# Display the received messages in one batch (GUI thread)
+	def DisplayMessages( self ) :
+		# Get and decode the waiting messages
+		messages = []
+		while True :
+			try : message, address = self.received.get_nowait()
+			except queue.Empty : break
+			# Show the raw message if it is not encoded
+			if self.secret.isChecked() :
+				try : message = base64.b64decode( message )
+				except binascii.Error : pass
+			messages.append( ( address, message.decode( errors='replace' ) ) )
+		if not messages : return
+		# Follow the last messages if the chat history is scrolled to the bottom
+		scroll_bar = self.chat.verticalScrollBar()
+		follow = scroll_bar.value() == scroll_bar.maximum()
+		# Append the messages to the chat history, in one edit of the document
+		cursor = QTextCursor( self.chat.document() )
+		cursor.movePosition( QTextCursor.End )
+		cursor.beginEditBlock()
+		for address, message in messages :
+			if not self.chat.document().isEmpty() : cursor.insertBlock()
+			cursor.insertHtml( f'<b>{address} ></b> {message}' )
+		cursor.endEditBlock()
+		if follow : scroll_bar.setValue( scroll_bar.maximum() )
+		# Log the messages
+		logger.info( '\n'.join( f'{address} > {message}' for address, message in messages ) )
+	# Show the number of dropped messages (display queue full, or kernel receive buffer full)
+	def ShowDrops( self ) :
+		kernel = ( kernel_drops( self.server.socket ) if self.server else None ) or 0
+		if self.dropped or kernel : self.received_label.setText( f'Message received : ( {self.dropped} messages dropped, {kernel} by the kernel )' )
 
 # Main program
 if __name__ == "__main__" :
-	application = QApplication( sys.argv )
+	# Command line parameters (the other ones are for Qt)
+	parser = argparse.ArgumentParser( description='Multicast Chat Application', formatter_class=argparse.ArgumentDefaultsHelpFormatter )
+	parser.add_argument( '--rcvbuf', type=int, default=RECEIVE_BUFFER, help='Socket receive buffer size (0 for the system default)' )
+	parser.add_argument( '--sndbuf', type=int, default=SEND_BUFFER, help='Socket send buffer size (0 for the system default)' )
+	args, qt_args = parser.parse_known_args()
+	# Get socket buffer sizes
+	RECEIVE_BUFFER = args.rcvbuf
+	SEND_BUFFER = args.sndbuf
+	# Run the application
+	application = QApplication( sys.argv[:1] + qt_args )
 	window = MulticastChat()
 	window.show()
 	sys.exit( application.exec() )
\ No newline at end of file
@@ -7,12 +7,15 @@
 #
 
 # External dependencies
+import argparse
 import asyncio
 import base64
+import binascii
 import logging
-import re
+import os
 import socket
 try:
+	from rich.text import Text
 	from textual.app import App
 	from textual.widgets import Footer, Input, RichLog, Static
 except ImportError as error: print( error ); exit()
@@ -21,31 +24,68 @@ except ImportError as error: print( error ); exit()
 MULTICAST_ADDRESS4 = '239.0.0.1'
 MULTICAST_ADDRESS6 = 'FF02::239:0:0:1'
 MULTICAST_PORT = 10000
+# Socket buffer sizes in bytes (0 for the system default)
+RECEIVE_BUFFER = 4 * 1024 * 1024
+SEND_BUFFER = 0
+# Maximum number of datagrams read at each wakeup of the event loop
+BATCH_SIZE = 256
+# Maximum number of received messages waiting for display (the next ones are dropped)
+QUEUE_SIZE = 10000
+# Display interval of the received messages
+DISPLAY_INTERVAL = 0.05
 
 # Logging
 logger = logging.getLogger()
 logging.basicConfig( filename='/tmp/chat.log', level=logging.INFO, format='[ %(asctime)s ] ( %(module)s ) %(message)s' )
 
-# Chat server protocol
-class ChatProtocol :
+# Set the size of a socket buffer (0 for the system default), return the size given by the kernel
+# Without root, the size is limited by the system (sysctl net.core.rmem_max and net.core.wmem_max)
+def set_buffer( sock, option, size ) :
+	if size : sock.setsockopt( socket.SOL_SOCKET, option, size )
+	return sock.getsockopt( socket.SOL_SOCKET, option )
+
+# Number of datagrams dropped by the kernel for a socket (receive buffer full), None if not available (Linux only)
+def kernel_drops( sock ) :
+	inode = str( os.fstat( sock.fileno() ).st_ino )
+	try :
+		with open( '/proc/net/udp6' ) as file :
+			for line in file :
+				fields = line.split()
+				if fields[9] == inode : return int( fields[-1] )
+	except ( OSError, IndexError, ValueError ) : pass
+	return None
+
+# Chat server, reading the datagrams from a non-blocking socket
+# All the waiting datagrams are read at each wakeup of the event loop, and sent to the application as a list
+class ChatServer :
 	# Initialisation
-	def __init__( self, message_callback ) :
-		# Register the message callback from the application
-		self.message_callback = message_callback
-	# Socket initialisation
-	def connection_made( self, transport ) :
+	def __init__( self, messages_callback ) :
+		# Register the messages callback from the application
+		self.messages_callback = messages_callback
+		# Create the socket, with the receive buffer size
+		self.socket = socket.socket( socket.AF_INET6, socket.SOCK_DGRAM )
+		self.socket.setblocking( False )
+		set_buffer( self.socket, socket.SO_RCVBUF, RECEIVE_BUFFER )
+		self.socket.bind( ( '::', MULTICAST_PORT ) )
 		# Register the IPv4 multicast group
-		transport.get_extra_info('socket').setsockopt( socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+		self.socket.setsockopt( socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
 			socket.inet_aton( MULTICAST_ADDRESS4 ) + socket.inet_aton( '0.0.0.0' ) )
 		# Register the IPv6 multicast group
-		transport.get_extra_info('socket').setsockopt( socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP,
+		self.socket.setsockopt( socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP,
 			socket.inet_pton( socket.AF_INET6, MULTICAST_ADDRESS6 ) + socket.inet_pton( socket.AF_INET6, '::' ) )
-	# Message reception
-	def datagram_received( self, message, address ) :
-		# Cleanup the address
-		address = re.sub( r'^::ffff:', '', address[0] )
-		# Send the message to the application
-		self.message_callback( message, address )
+		# Read the datagrams from the event loop
+		asyncio.get_running_loop().add_reader( self.socket, self.receive )
+	# Messages reception
+	def receive( self ) :
+		messages = []
+		# Read the waiting datagrams
+		while len( messages ) < BATCH_SIZE :
+			try : message, address = self.socket.recvfrom( 65535 )
+			except OSError : break
+			# Cleanup the address
+			messages.append( ( message, address[0].removeprefix( '::ffff:' ) ) )
+		# Send the messages to the application
+		if messages : self.messages_callback( messages )
 
 # Multicast Chat using Textual
 class MulticastChat( App ) :
@@ -93,55 +133,91 @@ class MulticastChat( App ) :
 		yield Footer( id='footer' )
 	# Initialize the application
 	async def on_mount( self ) :
+		# Get the widgets
+		self.messages = self.query_one( '#messages', RichLog )
+		self.input = self.query_one( '#input', Input )
 		# Setup the interface
-		self.query_one( '#messages' ).border_title = 'Message received'
-		self.query_one( '#messages' ).can_focus = False
-		self.query_one( '#input' ).border_title='Send a message'
+		self.messages.border_title = 'Message received'
+		self.messages.can_focus = False
+		self.input.border_title='Send a message'
 		# Setup message options
 		self.ipv4_enabled = True
 		self.secret_enabled = False
-		self.query_one( '#messages' ).write( '[bold cyan]Sending messages via IPv4\nSecret disabled[/bold cyan]' )
+		self.messages.write( '[bold cyan]Sending messages via IPv4\nSecret disabled[/bold cyan]' )
+		# Received messages waiting for display, and number of dropped messages
+		self.received = asyncio.Queue( QUEUE_SIZE )
+		self.dropped = 0
+		# Display the received messages in batches, and the dropped messages every second
+		self.set_interval( DISPLAY_INTERVAL, self.DisplayMessages )
+		self.set_interval( 1, self.ShowDrops )
 		# Run the server
-		await asyncio.get_running_loop().create_datagram_endpoint(
-			lambda : ChatProtocol( self.ReceiveMessage ), local_addr = ( '::', MULTICAST_PORT ) )
+		self.server = ChatServer( self.ReceiveMessages )
 		# Create the client
 		self.client = socket.socket( socket.AF_INET6, socket.SOCK_DGRAM )
+		set_buffer( self.client, socket.SO_SNDBUF, SEND_BUFFER )
 	# Enable IPv4
 	def action_enable_ipv4( self ) :
 		self.ipv4_enabled = True
-		self.query_one( '#messages' ).write( '[bold cyan]Sending messages via IPv4[/bold cyan]' )
+		self.messages.write( '[bold cyan]Sending messages via IPv4[/bold cyan]' )
 	# Enable IPv6
 	def action_enable_ipv6( self ) :
 		self.ipv4_enabled = False
-		self.query_one( '#messages' ).write( '[bold cyan]Sending messages via IPv6[/bold cyan]' )
+		self.messages.write( '[bold cyan]Sending messages via IPv6[/bold cyan]' )
 	# Enable secret message
 	def action_enable_secret( self ) :
 		self.secret_enabled = not self.secret_enabled
-		self.query_one( '#messages' ).write( f'[bold cyan]Secret {'enabled' if self.secret_enabled else 'disabled'}[/bold cyan]' )
+		self.messages.write( f'[bold cyan]Secret {'enabled' if self.secret_enabled else 'disabled'}[/bold cyan]' )
 	# Input submitted
 	def on_input_submitted( self ) :
 		# Return if input is empty
-		if not self.query_one( '#input' ).value : return
+		if not self.input.value : return
 		# Get the message
-		message = self.query_one( '#input' ).value.encode()
+		message = self.input.value.encode()
 		# Encode the message if secret
 		if self.secret_enabled : message = base64.b64encode( message )
 		# Send the message
 		if self.ipv4_enabled : self.client.sendto( message, ( f'::ffff:{MULTICAST_ADDRESS4}', MULTICAST_PORT ) )
 		else : self.client.sendto( message, ( MULTICAST_ADDRESS6, MULTICAST_PORT ) )
 		# Clear input
-		self.query_one( '#input' ).clear()
-	# Receive a message
-	def ReceiveMessage( self, message, address ) :
-		# Decode the message
-		if self.secret_enabled : message = base64.b64decode( message )
-		message = message.decode()
-		# Append the message to the chat history
-		self.query_one( '#messages' ).write( f'[b]{address} >[/b] {message}' )
-		# Log the message
-		logger.info( f'{address} > {message}' )
+		self.input.clear()
+	# Receive the messages, queued for display
+	def ReceiveMessages( self, messages ) :
+		for message in messages :
+			try : self.received.put_nowait( message )
+			# Drop the message if the queue is full
+			except asyncio.QueueFull : self.dropped += 1
+	# Display the received messages in one batch
+	def DisplayMessages( self ) :
+		# Get and decode the waiting messages
+		messages = []
+		while not self.received.empty() :
+			message, address = self.received.get_nowait()
+			# Show the raw message if it is not encoded
+			if self.secret_enabled :
+				try : message = base64.b64decode( message )
+				except binascii.Error : pass
+			messages.append( ( address, message.decode( errors='replace' ) ) )
+		if not messages : return
+		# Append the messages to the chat history
+		# The received text is written as plain text, not interpreted as markup
+		self.messages.write( Text( '\n' ).join( Text.assemble( ( f'{address} >', 'bold' ), f' {message}' ) for address, message in messages ) )
+		# Log the messages
+		logger.info( '\n'.join( f'{address} > {message}' for address, message in messages ) )
+	# Show the number of dropped messages (display queue full, or kernel receive buffer full)
+	def ShowDrops( self ) :
+		kernel = kernel_drops( self.server.socket ) or 0
+		if self.dropped or kernel : self.messages.border_subtitle = f'{self.dropped} messages dropped, {kernel} by the kernel'
 
 # Main application
 if __name__ == "__main__" :
+	# Command line parameters
+	parser = argparse.ArgumentParser( description='Multicast Chat Application', formatter_class=argparse.ArgumentDefaultsHelpFormatter )
+	parser.add_argument( '--rcvbuf', type=int, default=RECEIVE_BUFFER, help='Socket receive buffer size (0 for the system default)' )
+	parser.add_argument( '--sndbuf', type=int, default=SEND_BUFFER, help='Socket send buffer size (0 for the system default)' )
+	args = parser.parse_args()
+	# Get socket buffer sizes
+	RECEIVE_BUFFER = args.rcvbuf
+	SEND_BUFFER = args.sndbuf
+	# Run the application
 	app = MulticastChat()
 	app.run()
\ No newline at end of file
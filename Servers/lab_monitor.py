@@ -0,0 +1,424 @@
+#
+# Network Lab Monitoring Probes
+# Shared by the monitoring applications (test-connexion.py and test-connexion-rich.py)
+# https://github.com/microy/rt-auxerre
+# Copyright (c) 2026 Michaël Roy
+#
+
+# Dependencies
+import asyncio
+import ipaddress
+import itertools
+import os
+import queue
+import socket
+import sqlite3
+import ssl
+import statistics
+import struct
+import threading
+import time
+import tomllib
+from collections import deque
+from datetime import datetime, timezone
+
+# Test parameters, set by the monitoring applications from their command line
+# Number of areas to test
+AREA_NUMBER = 8
+# Destination IP addresses with the area number
+IPV4_ADDRESS = '203.0.113.{area}'
+IPV6_ADDRESS = 'fd00:{area}1::1'
+# Target inventory file (TOML), instead of the area number and the destination addresses
+INVENTORY = None
+# Test timeout
+TIMEOUT = 2
+# Number of pings per update
+PING_COUNT = 3
+# Number of latency samples kept per target
+SAMPLES = 100
+# Test ping (disabled if not available)
+PING = True
+# Application protocols by port
+SERVICES = {
+	0: 'ICMP',
+	21: 'FTP',
+	22: 'SSH',
+	25: 'SMTP',
+	53: 'DNS',
+	80: 'HTTP',
+	443: 'HTTPS'
+}
+# Protocols tested by default
+PROTOCOLS = dict( SERVICES )
+
+
+# Ping socket parameters
+IP_FAMILY = {
+	4: socket.AF_INET, # IPv4
+	6: socket.AF_INET6 # IPv6
+}
+IP_PROTO = {
+	4: socket.IPPROTO_ICMP, # ICMPv4
+	6: socket.IPPROTO_ICMPV6 # ICMPv6
+}
+ICMP_ECHO_REQUEST = {
+	4: 8, # ICMPv4 echo request type
+	6: 128 # ICMPv6 echo request type
+}
+ICMP_ECHO_REPLY = {
+	4: 0, # ICMPv4 echo reply type
+	6: 129 # ICMPv6 echo reply type
+}
+ICMP_HEADER = struct.Struct( '!BBHHH' ) # Type, code, checksum, identifier, sequence number
+SOCKET_TYPE = {
+	False: socket.SOCK_DGRAM | socket.SOCK_NONBLOCK, # Non blocking ping socket (no root needed)
+	True: socket.SOCK_RAW | socket.SOCK_NONBLOCK # Non blocking raw socket
+}
+
+# Internet checksum
+def checksum( data ):
+	if len( data ) % 2: data += b'\x00'
+	total = sum( memoryview( data ).cast( 'H' ) )
+	total = ( total >> 16 ) + ( total & 0xffff )
+	total += total >> 16
+	return socket.htons( ~total & 0xffff )
+
+# Open a ping socket, or a raw socket if the ping sockets are not allowed (sysctl net.ipv4.ping_group_range)
+# Return the socket, and if it is a raw socket
+def open_ping_socket( ip_version ):
+	try: return socket.socket( IP_FAMILY[ip_version], SOCKET_TYPE[False], IP_PROTO[ip_version] ), False
+	except OSError: return socket.socket( IP_FAMILY[ip_version], SOCKET_TYPE[True], IP_PROTO[ip_version] ), True
+
+# Check if ping is available (ping socket or root)
+def ping_available():
+	try: open_ping_socket( 4 )[0].close()
+	except OSError: return False
+	return True
+
+# Ping socket shared by all the requests of one IP version
+# Replies are matched to the requests with the identifier and the sequence number
+# With a ping socket, the kernel sets the identifier and only delivers the replies to this socket
+class PingSocket:
+	# Initialisation
+	def __init__( self, ip_version ):
+		self.ip_version = ip_version
+		# Identifier of this process
+		self.identifier = os.getpid() & 0xffff
+		# Next sequence number
+		self.sequence = itertools.count()
+		# Pending requests by sequence number
+		self.requests = {}
+		# Create the network socket, and read the replies from the event loop
+		self.socket, self.raw = open_ping_socket( ip_version )
+		asyncio.get_running_loop().add_reader( self.socket, self.receive )
+	# Send a ping request, return the round-trip time
+	async def ping( self, destination ):
+		loop = asyncio.get_running_loop()
+		# Unique sequence number
+		sequence = next( self.sequence ) & 0xffff
+		# Echo request (the kernel computes the ICMPv6 checksum)
+		request = ICMP_HEADER.pack( ICMP_ECHO_REQUEST[self.ip_version], 0, 0, self.identifier, sequence ) + b'rt-auxerre'
+		if self.ip_version == 4: request = request[:2] + struct.pack( '!H', checksum( request ) ) + request[4:]
+		# Register the request
+		reply = self.requests[sequence] = ( destination, loop.create_future() )
+		try:
+			# Send the request
+			start_time = time.perf_counter()
+			await loop.sock_sendto( self.socket, request, ( str( destination ), 0 ) )
+			# Wait for the reply, timestamped on reception
+			return await asyncio.wait_for( reply[1], timeout=TIMEOUT ) - start_time
+		# Unregister the request
+		finally: del self.requests[sequence]
+	# Read all the received packets, and match the echo replies to the requests
+	def receive( self ):
+		while True:
+			try: packet, ( source, *_ ) = self.socket.recvfrom( 1024 )
+			except ( BlockingIOError, InterruptedError ): return
+			except OSError: continue
+			# Skip the IPv4 header of a raw socket
+			if self.raw and self.ip_version == 4: packet = packet[ ( packet[0] & 0x0f ) * 4 : ]
+			if len( packet ) < ICMP_HEADER.size: continue
+			# Check the echo reply
+			icmp_type, _, _, identifier, sequence = ICMP_HEADER.unpack_from( packet )
+			if icmp_type != ICMP_ECHO_REPLY[self.ip_version] or ( self.raw and identifier != self.identifier ): continue
+			# Get the pending request
+			destination, reply = self.requests.get( sequence, ( None, None ) )
+			if reply and not reply.done() and ipaddress.ip_address( source ) == destination:
+				reply.set_result( time.perf_counter() )
+
+# Ping sockets of this process by IP version
+PING_SOCKETS = {}
+
+# Ping a host (parsed address), return the round-trip time (None if no reply)
+async def ping( destination ):
+	# Get IP version
+	ip_version = destination.version
+	# Catch errors
+	try:
+		# Create the ping socket at the first request
+		if ip_version not in PING_SOCKETS: PING_SOCKETS[ip_version] = PingSocket( ip_version )
+		# Send the ping request
+		return await PING_SOCKETS[ip_version].ping( destination )
+	# No reply or connection failed
+	except ( OSError, TimeoutError ): return None
+
+# TLS context accepting the self-signed certificates of the lab servers
+TLS_CONTEXT = ssl.create_default_context()
+TLS_CONTEXT.check_hostname = False
+TLS_CONTEXT.verify_mode = ssl.CERT_NONE
+
+# Read the banner of a service (FTP, SSH, SMTP), check its prefix
+async def check_banner( reader, writer, prefix ):
+	return ( await reader.readline() ).startswith( prefix ), None
+
+# Send a HTTP HEAD request, check the status code (no server error)
+async def check_http( reader, writer, _ ):
+	writer.write( b'HEAD / HTTP/1.0\r\nConnection: close\r\n\r\n' )
+	status_line = await reader.readline()
+	return status_line.startswith( b'HTTP/' ) and int( status_line.split()[1] ) < 500, None
+
+# Get an element of a DER encoded structure (tag, start and end of the content)
+def der_element( data, offset ):
+	tag, length = data[offset], data[offset + 1]
+	offset += 2
+	# Long form length
+	if length & 0x80:
+		length, offset = int.from_bytes( data[ offset : offset + ( length & 0x7f ) ] ), offset + ( length & 0x7f )
+	return tag, offset, offset + length
+
+# Get the expiry date of a DER encoded certificate
+def certificate_expiry( certificate ):
+	# Certificate and TBSCertificate sequences
+	_, offset, _ = der_element( certificate, 0 )
+	_, offset, _ = der_element( certificate, offset )
+	# Skip the version (optional), the serial number, the signature algorithm and the issuer
+	if certificate[offset] == 0xa0: offset = der_element( certificate, offset )[2]
+	for _ in range( 3 ): offset = der_element( certificate, offset )[2]
+	# Validity sequence, skip the start date
+	_, offset, _ = der_element( certificate, offset )
+	offset = der_element( certificate, offset )[2]
+	# Expiry date (UTCTime or GeneralizedTime)
+	tag, start, end = der_element( certificate, offset )
+	return datetime.strptime( certificate[ start : end ].decode(), '%y%m%d%H%M%SZ' if tag == 0x17 else '%Y%m%d%H%M%SZ' ).replace( tzinfo=timezone.utc )
+
+# Check the TLS handshake done, and the expiry date of the server certificate
+async def check_tls( reader, writer, _ ):
+	days = ( certificate_expiry( writer.get_extra_info( 'ssl_object' ).getpeercert( binary_form=True ) ) - datetime.now( timezone.utc ) ).days
+	return days >= 0, f'cert {days} d'
+
+# DNS endpoint shared by all the queries of one IP version
+# Replies are matched to the queries with the transaction identifier and the source address
+class DnsEndpoint( asyncio.DatagramProtocol ):
+	# Initialisation
+	def __init__( self ):
+		# Next transaction identifier
+		self.identifier = itertools.count( os.getpid() )
+		# Pending queries by identifier and destination
+		self.queries = {}
+	# Get the transport
+	def connection_made( self, transport ):
+		self.transport = transport
+	# Match a reply to its query
+	def datagram_received( self, data, address ):
+		reply = self.queries.get( ( data[:2], ipaddress.ip_address( address[0] ) ) )
+		if reply and not reply.done(): reply.set_result( True )
+	# Send a query for the root name servers, wait for any reply
+	async def query( self, destination ):
+		identifier = ( next( self.identifier ) & 0xffff ).to_bytes( 2 )
+		key = ( identifier, destination )
+		reply = self.queries[key] = asyncio.get_running_loop().create_future()
+		try:
+			# Header (recursion desired, one question) and question ( . NS IN )
+			self.transport.sendto( identifier + b'\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00' + b'\x00\x00\x02\x00\x01', ( str( destination ), 53 ) )
+			return await reply
+		finally: del self.queries[key]
+
+# DNS endpoints of this process by IP version
+DNS_ENDPOINTS = {}
+
+# Send a DNS query over UDP
+async def check_dns( address, _ ):
+	ip_version = address.version
+	# Create the DNS endpoint at the first query
+	if ip_version not in DNS_ENDPOINTS:
+		DNS_ENDPOINTS[ip_version] = asyncio.ensure_future( asyncio.get_running_loop().create_datagram_endpoint( DnsEndpoint, family=IP_FAMILY[ip_version] ) )
+	_, endpoint = await DNS_ENDPOINTS[ip_version]
+	return await endpoint.query( address ), None
+
+# Service checks by port : transport, check function, argument, timeout (multiple of the test timeout)
+# The other ports are checked with a TCP connection (TCP_CHECK)
+CHECKS = {
+	21: ( 'tcp', check_banner, b'220', 1 ), # FTP greeting
+	22: ( 'tcp', check_banner, b'SSH-', 1 ), # SSH version
+	25: ( 'tcp', check_banner, b'220', 2 ), # SMTP greeting (can be delayed)
+	53: ( 'udp', check_dns, None, 1 ), # DNS query over UDP
+	80: ( 'tcp', check_http, None, 1 ), # HTTP HEAD request
+	443: ( 'tls', check_tls, None, 2 ) # TLS handshake and certificate expiry
+}
+TCP_CHECK = ( 'tcp', None, None, 1 )
+
+# Check a service (service check of the probe plan), return the check time (None if failed) and the check details
+async def check( address, port, service ):
+	transport, function, argument, timeout = service
+	start_time = time.perf_counter()
+	# Check a service over UDP
+	if transport == 'udp':
+		try:
+			async with asyncio.timeout( TIMEOUT * timeout ): result, details = await function( address, argument )
+		except ( OSError, TimeoutError ): return None, None
+		return time.perf_counter() - start_time if result else None, details
+	# Check a service over TCP
+	writer = None
+	try:
+		async with asyncio.timeout( TIMEOUT * timeout ):
+			reader, writer = await asyncio.open_connection( host=str( address ), port=port, ssl=TLS_CONTEXT if transport == 'tls' else None )
+			result, details = await function( reader, writer, argument ) if function else ( True, None )
+		return time.perf_counter() - start_time if result else None, details
+	# Check failed
+	except ( OSError, ValueError, IndexError, TimeoutError ): return None, None
+	# Close the connection
+	finally:
+		if writer:
+			writer.close()
+			try: await asyncio.wait_for( writer.wait_closed(), timeout=TIMEOUT )
+			except ( OSError, TimeoutError ): pass
+
+# Latency statistics of one target (address and port)
+class Latency:
+	# Initialisation
+	def __init__( self ):
+		# Ring buffer of the last round-trip times (None for a lost probe)
+		self.samples = deque( maxlen=SAMPLES )
+		# Details of the last service check
+		self.details = None
+	# Add the round-trip times of one update
+	def add( self, rtts ):
+		self.samples.extend( rtts )
+		# Average round-trip time of this update
+		rtts = [ rtt for rtt in rtts if rtt is not None ]
+		self.last = statistics.fmean( rtts ) if rtts else None
+	# Minimum, average, maximum, jitter (in milliseconds) and loss (in percent)
+	def summary( self ):
+		rtts = [ 1000 * rtt for rtt in self.samples if rtt is not None ]
+		loss = 100 * ( len( self.samples ) - len( rtts ) ) / len( self.samples ) if self.samples else 0
+		if not rtts: return None, None, None, None, loss
+		# Jitter is the mean difference between consecutive round-trip times
+		jitter = statistics.fmean( abs( b - a ) for a, b in itertools.pairwise( rtts ) ) if len( rtts ) > 1 else 0
+		return min( rtts ), statistics.fmean( rtts ), max( rtts ), jitter, loss
+
+# Latency statistics by target
+LATENCY = {}
+
+# Test a host (service check or ping), return the result and the latency statistics
+async def test_host( address, port, service ):
+	latency = LATENCY.setdefault( ( address, port ), Latency() )
+	# Check the service
+	if service:
+		rtt, latency.details = await check( address, port, service )
+		rtts = [ rtt ]
+	# Test ping, with all the requests sent together
+	else: rtts = await asyncio.gather( *( ping( address ) for _ in range( PING_COUNT ) ) )
+	# Save the latencies
+	latency.add( rtts )
+	# Return test result
+	return ( port, any( rtt is not None for rtt in rtts ), latency )
+
+# Probe plan, compiled from the inventory file (or the command line) when it is loaded, and used by all the updates
+# The destination addresses are parsed and the service checks found once, not at each update
+class Plan:
+	# Initialisation
+	def __init__( self ):
+		# Tested areas : address and tested ports by IP version
+		self.areas = {}
+		# Tested ports of all the areas
+		self.ports = []
+		# Probes of one update : area, address, port, service check (None for ping)
+		self.probes = []
+	# Get the targets : area, destination addresses by IP version, tested services
+	def targets( self ):
+		# Areas of the command line
+		if not INVENTORY:
+			return [ ( area, { 4: IPV4_ADDRESS.format( area=area ), 6: IPV6_ADDRESS.format( area=area ) }, PROTOCOLS.values() )
+				for area in range( 1, AREA_NUMBER + 1 ) ]
+		# Areas of the inventory file, with the services of all the areas by default
+		with open( INVENTORY, 'rb' ) as file: inventory = tomllib.load( file )
+		services = inventory.get( 'services', PROTOCOLS.values() )
+		return [ ( area.get( 'name', number ), { version: area[f'ipv{version}'] for version in ( 4, 6 ) if f'ipv{version}' in area }, area.get( 'services', services ) )
+			for number, area in enumerate( inventory.get( 'area', [] ), 1 ) ]
+	# Load the plan, return the error if the inventory is not valid (the current plan is kept)
+	def load( self ):
+		ports = { name: port for port, name in SERVICES.items() }
+		areas = {}
+		try:
+			for area, addresses, services in self.targets():
+				# Check the area
+				if area in areas: raise ValueError( f'Duplicate area {area}' )
+				unknown = [ name for name in services if name.upper() not in ports ]
+				if unknown: raise ValueError( f'Unknown service {', '.join( unknown )} in area {area}' )
+				# Parse the addresses and the services
+				areas[area] = {}
+				for version, address in addresses.items():
+					address = ipaddress.ip_address( address )
+					if address.version != version: raise ValueError( f'{address} is not an IPv{version} address' )
+					areas[area][version] = ( address, sorted( ports[ name.upper() ] for name in services if ports[ name.upper() ] or PING ) )
+		except ( OSError, ValueError, TypeError, AttributeError ) as error: return error
+		# Probes, one area after the other for each protocol to spread the load on the destinations
+		self.ports = sorted( { port for versions in areas.values() for _, area_ports in versions.values() for port in area_ports } )
+		probes = []
+		for port in self.ports:
+			for version in ( 4, 6 ):
+				for area, versions in areas.items():
+					address, area_ports = versions.get( version, ( None, () ) )
+					if port in area_ports: probes.append( ( area, address, port, CHECKS.get( port, TCP_CHECK ) if port else None ) )
+		self.areas = areas
+		self.probes = probes
+
+# Probe plan of the tested areas
+PLAN = Plan()
+
+# History of the test results in a SQLite database, written in batches by a background thread
+class History:
+	# Initialisation
+	def __init__( self, filename, days, rows ):
+		# History parameters
+		self.filename = filename
+		self.days = days
+		self.rows = rows
+		# Results queued by the tests
+		self.records = queue.SimpleQueue()
+		self.thread = None
+	# Start the writer thread
+	def start( self ):
+		self.thread = threading.Thread( target=self.run, daemon=True )
+		self.thread.start()
+	# Stop the writer thread, after writing the queued results
+	def stop( self ):
+		if not self.thread: return
+		self.records.put( None )
+		self.thread.join()
+	# Queue a test result (one row per probe)
+	def record( self, area, address, port, result, latency ):
+		self.records.put( ( time.time(), area, address.version, SERVICES[port], int( result ), latency.last ) )
+	# Write the queued results in batches
+	def run( self ):
+		database = sqlite3.connect( self.filename )
+		database.execute( 'PRAGMA journal_mode=WAL' )
+		database.execute( 'CREATE TABLE IF NOT EXISTS probes ( time REAL, area TEXT, family INTEGER, protocol TEXT, up INTEGER, latency REAL )' )
+		database.execute( 'CREATE INDEX IF NOT EXISTS probes_time ON probes ( time )' )
+		last_cleanup = 0
+		while True:
+			# Wait for a result, then get all the queued ones
+			batch = [ self.records.get() ]
+			while len( batch ) < 4096:
+				try: batch.append( self.records.get_nowait() )
+				except queue.Empty: break
+			# Insert the batch in one transaction
+			with database: database.executemany( 'INSERT INTO probes VALUES ( ?, ?, ?, ?, ?, ? )', [ record for record in batch if record ] )
+			# Remove the old results every minute
+			if time.monotonic() - last_cleanup > 60:
+				last_cleanup = time.monotonic()
+				with database:
+					if self.days: database.execute( 'DELETE FROM probes WHERE time < ?', ( time.time() - self.days * 86400, ) )
+					if self.rows: database.execute( 'DELETE FROM probes WHERE rowid <= ( SELECT MAX( rowid ) FROM probes ) - ?', ( self.rows, ) )
+			# Stop the thread
+			if None in batch: return database.close()
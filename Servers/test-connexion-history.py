@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+
+#
+# Network Lab Monitoring History
+# https://github.com/microy/rt-auxerre
+# Copyright (c) 2026 Michaël Roy
+# usage : $ ./test-connexion-history.py history.db --uptime
+#         $ ./test-connexion-history.py history.db --csv results.csv
+#
+
+# Dependencies
+import argparse
+import contextlib
+import csv
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+# Selected results
+def select( database, columns, since, area, end='' ):
+	# Filter the results by time and area
+	query = f'SELECT {columns} FROM probes WHERE time >= ?'
+	parameters = [ time.time() - since * 3600 if since else 0 ]
+	if area:
+		query += ' AND area = ?'
+		parameters.append( area )
+	return database.execute( query + end, parameters )
+
+# Export the results to a CSV file
+def export( database, filename, since, area ):
+	with open( filename, 'w', newline='' ) if filename != '-' else contextlib.nullcontext( sys.stdout ) as file:
+		writer = csv.writer( file )
+		writer.writerow( [ 'time', 'area', 'family', 'protocol', 'up', 'latency_ms' ] )
+		for timestamp, area_number, family, protocol, up, latency in select( database, '*', since, area, ' ORDER BY time' ):
+			writer.writerow( [ datetime.fromtimestamp( timestamp ).isoformat( timespec='seconds' ), area_number, f'IPv{family}',
+				protocol, up, f'{1000 * latency:.3f}' if latency is not None else '' ] )
+
+# Print the uptime of each area, IP version and protocol
+def uptime( database, since, area ):
+	print( '\n  -- Area --  -- Family --  -- Protocol --  -- Probes --  -- Uptime --  -- Latency --\n' )
+	for area_number, family, protocol, probes, up, latency in select( database, 'area, family, protocol, COUNT(*), 100.0 * AVG( up ), 1000 * AVG( latency )',
+		since, area, ' GROUP BY area, family, protocol ORDER BY area, family, protocol' ):
+		print( f'  {area_number:^10}  {f'IPv{family}':^12}  {protocol:^14}  {probes:12}  {up:10.1f} %  '
+			+ ( f'{latency:10.2f} ms' if latency is not None else f'{'-':>10}' ) )
+	print()
+
+# Main application
+if __name__ == '__main__':
+	# Command line parameters
+	parser = argparse.ArgumentParser( description='Network Lab Monitoring History', formatter_class=argparse.ArgumentDefaultsHelpFormatter )
+	parser.add_argument( 'history', help='SQLite database of the monitoring application (--history option)' )
+	parser.add_argument( '--csv', help='Export the results to this CSV file (- for the console)' )
+	parser.add_argument( '--uptime', action='store_true', help='Print the uptime of each area' )
+	parser.add_argument( '--since', type=float, help='Only the results of the last hours' )
+	parser.add_argument( '--area', help='Only the results of this area (number or inventory name)' )
+	args = parser.parse_args()
+	# Open the history read-only
+	try: database = sqlite3.connect( f'file:{args.history}?mode=ro', uri=True )
+	except sqlite3.Error as error: print( error ); exit()
+	# Export the results
+	if args.csv: export( database, args.csv, args.since, args.area )
+	# Print the uptime summary by default
+	if args.uptime or not args.csv: uptime( database, args.since, args.area )
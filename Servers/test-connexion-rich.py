@@ -15,16 +15,22 @@
 # Dependencies
 import argparse
 import asyncio
-import ipaddress
-import os
+import functools
+import resource
+import signal
 import socket
+import statistics
 import time
+import lab_monitor
+from lab_monitor import CHECKS, PLAN, SERVICES, History, ping_available, test_host
 try:
 	from rich import box, print
 	from rich.align import Align
 	from rich.columns import Columns
-	from rich.console import Console
+	from rich.console import Console, Group
+	from rich.live import Live
 	from rich.panel import Panel
+	from rich.spinner import Spinner
 	from rich.table import Table
 except ImportError as error: print( error ); exit()
 
@@ -44,179 +50,342 @@ class ColumnsFixed( Columns ):
 		else: width = self.width
 		return Measurement(width, width)
 
-# Number of areas to test
-AREA_NUMBER = 8
-# Destination IP addresses with the area number
-IPV4_ADDRESS = '203.0.113.{area}'
-IPV6_ADDRESS = 'fd00:{area}1::1'
 # Update interval time
 INTERVAL = 10
-# Test timeout
-TIMEOUT = 2
-# Application protocols by port
+# Start the next update before the end of the previous one
+OVERLAP = False
+# Port of the Prometheus exporter (0 for the dashboard)
+EXPORTER_PORT = 0
+# Run the tests when the metrics are scraped (exporter)
+PROBE_ON_SCRAPE = False
+# Maximum number of probes in flight
+MAX_INFLIGHT = 1000
+# Maximum number of probes per second to one destination address
+RATE = 10
+# Maximum delay between the start of two probes
+SPREAD_STEP = 0.01
+# Protocols tested by default
 PROTOCOLS = {
 	0: 'ICMP',
 	80: 'HTTP',
 	443: 'HTTPS'
 }
 
-# Ping socket parameters
-IP_FAMILY = {
-	4: socket.AF_INET, # IPv4
-	6: socket.AF_INET6 # IPv6
-}
-IP_PROTO = {
-	4: socket.IPPROTO_ICMP, # ICMPv4
-	6: socket.IPPROTO_ICMPV6 # ICMPv6
-}
-ICMP_TYPE = {
-	4: slice(20, 21), # ICMPv4 type field
-	6: slice(0, 1) # ICMPv6 type field
-}
-ICMP_ECHO_REQUEST = {
-	4: b'\x08\x00\xf7\xfe\x00\x00\x00\x01', # ICMPv4 echo request
-	6: b'\x80\x00\x7f\xfe\x00\x00\x00\x01' # ICMPv6 echo request
-}
-ICMP_ECHO_REPLY = {
-	4: b'\x00', # ICMPv4 echo reply
-	6: b'\x81' # ICMPv6 echo reply
-}
-SOCKET_TYPE = socket.SOCK_RAW | socket.SOCK_NONBLOCK # Non blocking raw socket
-
-# Ping a host
-async def ping( destination ):
-	# Get asyncio event loop
-	loop = asyncio.get_event_loop()
-	# Get IP version
-	ip_version = ipaddress.ip_address( destination ).version
-	# Catch errors
+# History of the test results (disabled by default)
+HISTORY = None
+
+# Probe scheduler with bounded concurrency and a rate limit per destination
+class Scheduler:
+	# Initialisation
+	def __init__( self ):
+		# Free slots for the probes in flight
+		self.slots = asyncio.Semaphore( MAX_INFLIGHT )
+		# Next allowed probe time by destination address
+		self.next_probe = {}
+	# Run a test at its start time (event loop time), within the limits
+	async def run( self, start_time, address, port, service ):
+		loop = asyncio.get_running_loop()
+		# Delay the test according to the rate limit of the destination
+		start_time = max( start_time, self.next_probe.get( address, 0 ) )
+		self.next_probe[ address ] = start_time + 1 / RATE
+		await asyncio.sleep( start_time - loop.time() )
+		# Wait for a free slot
+		async with self.slots: return await test_host( address, port, service )
+
+# Test all areas, yield each result as soon as it is received
+# ( area, address, port, result, latency statistics )
+async def test_all_areas( scheduler ):
+	# Spread the probe start times across the update interval, keeping time for the last timeouts
+	# (longest service check, and the wait for the connection close)
+	longest_probe = ( max( check[3] for check in CHECKS.values() ) + 1 ) * lab_monitor.TIMEOUT
+	step = min( max( INTERVAL - longest_probe, 0 ) / max( len( PLAN.probes ), 1 ), SPREAD_STEP )
+	start_time = asyncio.get_running_loop().time()
+	# Run a test, return its result with its target
+	async def test( start_time, area, address, port, service ):
+		_, result, latency = await scheduler.run( start_time, address, port, service )
+		return area, address, port, result, latency
+	# Schedule all the tests of the probe plan
+	tasks = [ asyncio.create_task( test( start_time + i * step, *probe ) ) for i, probe in enumerate( PLAN.probes ) ]
+	# Yield the results as they are received
 	try:
-		# Create network socket
-		with socket.socket( IP_FAMILY[ip_version], SOCKET_TYPE, IP_PROTO[ip_version] ) as icmp_socket:
-			# Connect the socket
-			await loop.sock_connect( icmp_socket, (destination, None) )
-			# Send ping request
-			await loop.sock_sendall( icmp_socket, ICMP_ECHO_REQUEST[ip_version] )
-			# Get reply
-			reply = await asyncio.wait_for( loop.sock_recv(icmp_socket, 1024), timeout=TIMEOUT )
-	# Connection failed
-	except OSError: return False
-	# Check reply
-	else: return True if reply[ICMP_TYPE[ip_version]] == ICMP_ECHO_REPLY[ip_version] else False
-
-# Connect to a TCP service
-async def connect( address, port ):
-	# Initiate a connection
-	try: _, writer = await asyncio.wait_for( asyncio.open_connection(host=address, port=port), timeout=TIMEOUT )
-	# Connection failed
-	except OSError: return False
-	# Connection done
-	else: writer.close(); return True
-
-# Test a host (TCP service or ping)
-async def test_host( address, port ):
-	# Test TCP service
-	if port: result = await connect( address, port )
-	# Test ping
-	else: result = await ping( address )
-	# Return test result
-	return ( port, result )
-
-# Test one area
-async def test_one_area( area ):
-	# Modify the destination addresses according to the area number
-	ipv4_destination = IPV4_ADDRESS.format( area=area )
-	ipv6_destination = IPV6_ADDRESS.format( area=area )
-	# Create a task group
-	async with asyncio.TaskGroup() as task_group:
-		# Do all the tests for this area
-		tasks = [ task_group.create_task( test_host( address, port ) )
-			for address in [ ipv4_destination, ipv6_destination ]
-			for port in PROTOCOLS.keys() ]
-	# Return the results of the tasks for this area
-	return [ task.result() for task in tasks ]
-
-# Test all areas
-async def test_all_areas():
-	# Create a task group
-	async with asyncio.TaskGroup() as task_group:
-		# Test all areas
-		tasks = [ task_group.create_task( test_one_area(i+1) ) for i in range( AREA_NUMBER ) ]
-	# Return the results of the tasks for each area
-	return [ task.result() for task in tasks ]
-
-# Richified the test result
-def output( test ):
-	return Panel.fit( f'{PROTOCOLS[test[0]]}', style=f'{'green' if test[1] else 'red dim'}', padding=(-1, 0) )
-
-# Monitoring application
+		for next_result in asyncio.as_completed( tasks ): yield await next_result
+	# Cancel the remaining tests if stopped
+	finally:
+		for task in tasks: task.cancel()
+
+# Richified the test result (None for a pending test), shared by all the cells
+@functools.cache
+def output( port, result ):
+	return Panel.fit( f'{SERVICES[port]}', style=f'{'dim' if result is None else 'green' if result else 'red dim'}', padding=(-1, 0) )
+
+# Format the latency statistics of one address for display
+# Ping min/avg/max/jitter and loss, average service check time, check details
+def output_latency( results ):
+	summaries = { port: latency.summary() for port, _, latency in results }
+	details = [ latency.details for _, _, latency in results if latency.details ]
+	# Ping statistics
+	minimum, average, maximum, jitter, loss = summaries.get( 0, ( None, None, None, None, 0 ) )
+	text = '' if 0 not in summaries else f'rtt {minimum:.2f}/{average:.2f}/{maximum:.2f}/{jitter:.2f} ms {loss:.0f} %' if average is not None else f'rtt - {loss:.0f} %'
+	# Service check time
+	averages = [ summary[1] for port, summary in summaries.items() if port and summary[1] is not None ]
+	if averages: text += f'  svc {statistics.fmean( averages ):.2f} ms'
+	# Service check details (certificate expiry)
+	if details: text += '  ' + '  '.join( details )
+	return text.strip()
+
+# Dashboard showing the results as they are received
+# The renderables of a cell are only rebuilt when its results change
+class Dashboard:
+	# Initialisation
+	def __init__( self ):
+		# Last results by area and IP version
+		self.results = {}
+		# Cached cells by area and IP version, with the state they show
+		self.cells = {}
+		# Cached table, rebuilt when a cell has changed
+		self.table = None
+		# Status line
+		self.status = Spinner( 'earth', 'Updating...' )
+	# Save a test result
+	def update( self, area, address, port, result, latency ):
+		self.results.setdefault( ( area, address.version ), {} )[ port ] = ( port, result, latency )
+		self.table = None
+	# Get the cell of an area and an IP version
+	def cell( self, area, version ):
+		results = self.results.get( ( area, version ), {} )
+		# State of the cell, with the protocols tested in the area
+		state = ( tuple( ( port, results[port][1] if port in results else None ) for port in PLAN.areas[area].get( version, ( None, () ) )[1] ),
+			output_latency( results.values() ) )
+		# Rebuild the cell if its state has changed
+		if self.cells.get( ( area, version ), ( None, ) )[0] != state:
+			self.cells[ ( area, version ) ] = ( state, Group(
+				Align.center( ColumnsFixed( [ output( port, result ) for port, result in state[0] ], padding=(-1, 0) ) ),
+				Align.center( f'[dim]{state[1]}' ) ) )
+		return self.cells[ ( area, version ) ][1]
+	# Build the table for result display
+	def build_table( self ):
+		table = Table( title='\n[bold white]IUT RT Auxerre - Network Lab Monitoring[/bold white]\n', box=box.HORIZONTALS, header_style='bold', style='white',
+			caption='\n[dim]rtt = ping min/avg/max/jitter (ms) and loss, svc = service check time (ms)\n' )
+		table.add_column( 'Area', style='bold', justify='center', vertical='middle', width=6 )
+		table.add_column( 'IPv4', justify='center' )
+		table.add_column( 'IPv6', justify='center' )
+		# Add the results to the table
+		for area in PLAN.areas:
+			table.add_row( f'{area}', self.cell( area, 4 ), self.cell( area, 6 ) )
+		return table
+	# Render the dashboard (called by Rich Live at each refresh)
+	def __rich__( self ):
+		if self.table is None: self.table = Align.center( self.build_table() )
+		return Group( self.table, Align.center( self.status ) )
+	# Reload the inventory (SIGHUP), and show the areas of the new probe plan
+	def reload( self ):
+		error = PLAN.load()
+		if error:
+			self.status = Spinner( 'clock', f'[red]Inventory not reloaded[/red] : {error}' )
+			return
+		self.results.clear()
+		self.cells.clear()
+		self.table = None
+	# Refresh the display from the event loop, to render the results between two updates
+	async def refresh( self, live ):
+		while True:
+			live.refresh()
+			await asyncio.sleep( 0.25 )
+
+# Run the tests of one update, and show the results as they are received
+async def update( dashboard, scheduler ):
+	start_time = time.monotonic()
+	dashboard.status = Spinner( 'earth', 'Updating...' )
+	async for test in test_all_areas( scheduler ):
+		dashboard.update( *test )
+		if HISTORY: HISTORY.record( *test )
+	dashboard.status = Spinner( 'clock', f'Last updated on [bold]{time.strftime('%X')}[/bold] in {time.monotonic() - start_time:.1f} s' )
+
+# Monitoring application
 async def main():
-	# Get number of tested protocols
-	protocol_number = int(len(PROTOCOLS.keys()))
-	# Get the console and clear it
-	console = Console()
-	console.clear()
-	print()
-	# Start console status
-	with console.status('') as status:
-		# Start monitoring
+	# Create the dashboard and the probe scheduler
+	dashboard = Dashboard()
+	scheduler = Scheduler()
+	# Reload the inventory on SIGHUP, without stopping the updates
+	asyncio.get_running_loop().add_signal_handler( signal.SIGHUP, dashboard.reload )
+	# Show the dashboard, refreshed in place
+	with Live( dashboard, auto_refresh=False, screen=True ) as live:
+		# Refresh the dashboard in a task group, which stops the application if the refresh fails
+		async with asyncio.TaskGroup() as tasks:
+			tasks.create_task( dashboard.refresh( live ) )
+			# Updates running in the background (overlapping updates)
+			updates = set()
+			# Start monitoring
+			while True:
+				# Run the tests
+				start_time = time.monotonic()
+				task = asyncio.create_task( update( dashboard, scheduler ) )
+				# Wait for the end of the update, or let it run with the next one
+				if not OVERLAP: await task
+				else: updates.add( task ); task.add_done_callback( updates.discard )
+				# Wait for the next update, at a fixed interval
+				await asyncio.sleep( max( start_time + INTERVAL - time.monotonic(), 0 ) )
+
+# Escape a label value of the Prometheus text format (backslash, double quote and line feed)
+def label_value( value ):
+	return str( value ).replace( '\\', '\\\\' ).replace( '"', '\\"' ).replace( '\n', '\\n' )
+
+# Prometheus exporter, serving the last test results on /metrics
+class Exporter:
+	# Initialisation
+	def __init__( self, scheduler ):
+		self.scheduler = scheduler
+		# Last results by area, IP version and protocol
+		self.results = {}
+		# Update in progress, and time of the last update
+		self.lock = asyncio.Lock()
+		self.last_update = None
+	# Save a test result, unless its probe was removed by an inventory reload during the update
+	def update( self, area, address, port, result, latency ):
+		plan_address, plan_ports = PLAN.areas.get( area, {} ).get( address.version, ( None, () ) )
+		if address != plan_address or port not in plan_ports: return
+		self.results[ ( area, f'IPv{address.version}', SERVICES[port] ) ] = ( result, latency.last )
+	# Reload the inventory (SIGHUP), and only export the results of the new probe plan
+	def reload( self ):
+		error = PLAN.load()
+		if error: return print( f'Inventory not reloaded : {error}' )
+		self.results.clear()
+	# Run the tests of one update
+	async def run_tests( self ):
+		start_time = time.monotonic()
+		async for test in test_all_areas( self.scheduler ):
+			self.update( *test )
+			if HISTORY: HISTORY.record( *test )
+		self.last_update = start_time
+	# Run the tests if the results are older than the update interval (one update for concurrent scrapes)
+	async def refresh( self ):
+		async with self.lock:
+			if self.last_update is None or time.monotonic() - self.last_update >= INTERVAL: await self.run_tests()
+	# Prometheus text response (headers + body)
+	def response( self ):
+		lines = [ '# HELP probe_success Result of the last test (1 for success).', '# TYPE probe_success gauge' ]
+		lines += [ f'probe_success{{area="{label_value( area )}",family="{family}",protocol="{protocol}"}} {int( result )}'
+			for ( area, family, protocol ), ( result, _ ) in self.results.items() ]
+		lines += [ '# HELP probe_duration_seconds Round-trip or service check time of the last successful test.', '# TYPE probe_duration_seconds gauge' ]
+		lines += [ f'probe_duration_seconds{{area="{label_value( area )}",family="{family}",protocol="{protocol}"}} {duration:.6f}'
+			for ( area, family, protocol ), ( _, duration ) in self.results.items() if duration is not None ]
+		body = bytes( '\n'.join( lines ) + '\n', 'utf-8' )
+		return bytes( f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {len( body )}\r\n\r\n', 'latin-1' ) + body
+	# Handle a HTTP connection (one request)
+	async def handle( self, reader, writer ):
+		try:
+			# Get the request line
+			request = await asyncio.wait_for( reader.readuntil( b'\r\n\r\n' ), timeout=lab_monitor.TIMEOUT )
+			request_line = request.decode( 'latin-1' ).split( '\r\n', 1 )[0].split()
+			# Bad request line
+			if len( request_line ) != 3: writer.write( b'HTTP/1.0 400 Bad Request\r\nConnection: close\r\nContent-Length: 0\r\n\r\n' )
+			# Send the metrics
+			elif request_line[:2] == [ 'GET', '/metrics' ]:
+				if PROBE_ON_SCRAPE: await self.refresh()
+				writer.write( b'HTTP/1.0 200 OK\r\nConnection: close\r\n' + self.response() )
+			# Unknown page
+			else: writer.write( b'HTTP/1.0 404 Not Found\r\nConnection: close\r\nContent-Length: 0\r\n\r\n' )
+			await writer.drain()
+		# Connection error
+		except ( OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, TimeoutError ): pass
+		# Close the connection
+		finally:
+			writer.close()
+			try: await writer.wait_closed()
+			except OSError: pass
+
+# Prometheus exporter application
+async def run_exporter():
+	# Create the exporter
+	exporter = Exporter( Scheduler() )
+	# Reload the inventory on SIGHUP, without stopping the tests
+	asyncio.get_running_loop().add_signal_handler( signal.SIGHUP, exporter.reload )
+	# Listen on IPv4 and IPv6
+	server = await asyncio.start_server( exporter.handle,
+		sock=socket.create_server( ( '::', EXPORTER_PORT ), family=socket.AF_INET6, dualstack_ipv6=True ) )
+	print( f'\nIUT RT Auxerre - Network Lab Monitoring - Exporter on port {EXPORTER_PORT}\nPress Ctrl+C to stop the application...\n' )
+	async with server:
+		# Only run the tests when the metrics are scraped
+		if PROBE_ON_SCRAPE: return await server.serve_forever()
+		# Run the tests at a fixed interval
 		while True:
-			# Update status
-			status.update( 'Updating...', spinner='earth' )
-			# Run the tests
-			tests = await test_all_areas()
-			# Create the table for result display
-			table = Table( title='\n[bold white]IUT RT Auxerre - Network Lab Monitoring[/bold white]\n', box=box.HORIZONTALS, header_style='bold', style='white', caption=' ' )
-			table.add_column( 'Area', style='bold', justify='center', vertical='middle', width=6 )
-			table.add_column( 'IPv4', justify='center' )
-			table.add_column( 'IPv6', justify='center' )
-			# Add the results to the table
-			for area, results in enumerate( tests ):
-				result = [ output(test) for test in results ]
-				table.add_row( f'{area + 1}',
-					Align.center( ColumnsFixed( result[:protocol_number], padding=(-1, 0) ) ),
-					Align.center( ColumnsFixed( result[protocol_number:], padding=(-1, 0) ) ) )
-			# Clear the screen
-			console.clear()
-			# Print the results
-			console.print( Align.center( table ) )
-			# Update status
-			status.update( f'Last updated on [bold]{time.strftime('%X')}', spinner='clock' )
-			# Wait for the next update
-			await asyncio.sleep( INTERVAL )
+			start_time = time.monotonic()
+			await exporter.run_tests()
+			await asyncio.sleep( max( start_time + INTERVAL - time.monotonic(), 0 ) )
 
 # Main application
 if __name__ == '__main__':
 	# Command line parameters
 	parser = argparse.ArgumentParser( description='Network Lab Monitoring Application', formatter_class=argparse.ArgumentDefaultsHelpFormatter )
-	parser.add_argument( '-n', '--number', type=int, default=AREA_NUMBER, help='Area number' )
+	parser.add_argument( '-n', '--number', type=int, default=lab_monitor.AREA_NUMBER, help='Area number' )
 	parser.add_argument( '-i', '--interval', type=int, default=INTERVAL, help='Refresh interval' )
-	parser.add_argument( '-t', '--timeout', type=int, default=TIMEOUT, help='Network test timeout' )
-	parser.add_argument( '-4', '--destination4', default=IPV4_ADDRESS, help='IPv4 destination address' )
-	parser.add_argument( '-6', '--destination6', default=IPV6_ADDRESS, help='IPv6 destination address' )
+	parser.add_argument( '-c', '--count', type=int, default=lab_monitor.PING_COUNT, help='Number of pings per update' )
+	parser.add_argument( '-s', '--samples', type=int, default=lab_monitor.SAMPLES, help='Number of latency samples kept per target' )
+	parser.add_argument( '-t', '--timeout', type=int, default=lab_monitor.TIMEOUT, help='Network test timeout' )
+	parser.add_argument( '-m', '--max-inflight', type=int, default=MAX_INFLIGHT, help='Maximum number of probes in flight' )
+	parser.add_argument( '-r', '--rate', type=float, default=RATE, help='Maximum number of probes per second to one destination' )
+	parser.add_argument( '-o', '--overlap', action='store_true', help='Start the next update before the end of the previous one' )
+	parser.add_argument( '--history', help='Save the test results in this SQLite database' )
+	parser.add_argument( '--history-days', type=float, default=30, help='Number of days kept in the history (0 for no limit)' )
+	parser.add_argument( '--history-rows', type=int, default=10000000, help='Number of results kept in the history (0 for no limit)' )
+	parser.add_argument( '--exporter', type=int, default=EXPORTER_PORT, metavar='PORT', help='Run as a Prometheus exporter on this port, without the dashboard' )
+	parser.add_argument( '--probe-on-scrape', action='store_true', help='Run the tests when the metrics are scraped (exporter)' )
+	parser.add_argument( '-4', '--destination4', default=lab_monitor.IPV4_ADDRESS, help='IPv4 destination address' )
+	parser.add_argument( '-6', '--destination6', default=lab_monitor.IPV6_ADDRESS, help='IPv6 destination address' )
 	parser.add_argument( '--ftp', action='store_true', help='Test FTP service' )
 	parser.add_argument( '--ssh', action='store_true', help='Test SSH service' )
 	parser.add_argument( '--smtp', action='store_true', help='Test SMTP service' )
 	parser.add_argument( '--dns', action='store_true', help='Test DNS service' )
+	parser.add_argument( '--inventory', help='Target inventory file (TOML), instead of the area number and the destination addresses (reloaded on SIGHUP)' )
 	args = parser.parse_args()
-	# Check if root
-	if os.geteuid() != 0: print( '\n-> Run this application as root (sudo)...'); exit()
+	# Test the TCP services only if ping is not available
+	if not ping_available():
+		print( '\n-> Ping disabled, run this application as root (sudo) or allow the ping sockets (sysctl net.ipv4.ping_group_range)...' )
+		lab_monitor.PING = False
+		time.sleep( 2 )
 	# Get area number
-	AREA_NUMBER = args.number
+	lab_monitor.AREA_NUMBER = args.number
 	# Get destination IP addresses
-	IPV4_ADDRESS = args.destination4
-	IPV6_ADDRESS = args.destination6
+	lab_monitor.IPV4_ADDRESS = args.destination4
+	lab_monitor.IPV6_ADDRESS = args.destination6
+	# Get target inventory file
+	lab_monitor.INVENTORY = args.inventory
 	# Get update interval parameter
 	INTERVAL = args.interval
 	# Get timeout parameter
-	TIMEOUT = args.timeout
+	lab_monitor.TIMEOUT = args.timeout
+	# Get latency measurement parameters
+	lab_monitor.PING_COUNT = args.count
+	lab_monitor.SAMPLES = args.samples
+	# Get overlapping updates parameter
+	OVERLAP = args.overlap
+	# Get Prometheus exporter parameters
+	EXPORTER_PORT = args.exporter
+	PROBE_ON_SCRAPE = args.probe_on_scrape
+	# Create the history of the test results
+	if args.history: HISTORY = History( args.history, args.history_days, args.history_rows )
+	# Get scheduler parameters
+	MAX_INFLIGHT = args.max_inflight
+	RATE = args.rate
+	# Raise the open file limit for the probes in flight
+	soft_limit, hard_limit = resource.getrlimit( resource.RLIMIT_NOFILE )
+	file_limit = MAX_INFLIGHT + 64 if hard_limit == resource.RLIM_INFINITY else min( MAX_INFLIGHT + 64, hard_limit )
+	if soft_limit < file_limit: resource.setrlimit( resource.RLIMIT_NOFILE, ( file_limit, hard_limit ) )
 	# Get additional services to test
 	if args.ftp: PROTOCOLS[ 21 ] = 'FTP'
 	if args.ssh: PROTOCOLS[ 22 ] = 'SSH'
 	if args.smtp: PROTOCOLS[ 25 ] = 'SMTP'
 	if args.dns: PROTOCOLS[ 53 ] = 'DNS'
-	PROTOCOLS = dict( sorted( PROTOCOLS.items() ) )
+	lab_monitor.PROTOCOLS = dict( sorted( PROTOCOLS.items() ) )
+	# Compile the probe plan
+	error = PLAN.load()
+	if error: print( f'\n-> Invalid inventory : {error}\n' ); exit()
+	# Start the history writer
+	if HISTORY: HISTORY.start()
 	# Run the monitoring application
-	try: asyncio.run( main() )
+	try: asyncio.run( run_exporter() if EXPORTER_PORT else main() )
 	# Ctrl+C to stop the application
-	except KeyboardInterrupt: Console().clear()
\ No newline at end of file
+	except KeyboardInterrupt:
+		if not EXPORTER_PORT: Console().clear()
+	# Write the last results to the history
+	if HISTORY: HISTORY.stop()
\ No newline at end of file
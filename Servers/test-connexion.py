@@ -9,166 +9,206 @@
 # Dependencies
 import argparse
 import asyncio
-import ipaddress
-import os
-import socket
+import itertools
+import resource
+import signal
+import statistics
 import time
+import lab_monitor
+from lab_monitor import PLAN, SERVICES, History, ping_available, test_host
 
-# Number of areas to test
-AREA_NUMBER = 8
-# Destination IP addresses with the area number
-IPV4_ADDRESS = '203.0.113.{area}'
-IPV6_ADDRESS = 'fd00:{area}1::1'
 # Update interval time
 INTERVAL = 10
-# Test timeout
-TIMEOUT = 2
-# Application protocols by port
-PROTOCOLS = {
-	0: 'ICMP',
-	21: 'FTP',
-	22: 'SSH',
-	25: 'SMTP',
-	53: 'DNS',
-	80: 'HTTP',
-	443: 'HTTPS'
-}
-PROTOCOL_NUMBER = int(len(PROTOCOLS.keys()))
-PROTOCOL_DISPLAY = sum([len(value)+2 for value in PROTOCOLS.values()])+PROTOCOL_NUMBER-9
-
-# Ping socket parameters
-IP_FAMILY = {
-	4: socket.AF_INET, # IPv4
-	6: socket.AF_INET6 # IPv6
-}
-IP_PROTO = {
-	4: socket.IPPROTO_ICMP, # ICMPv4
-	6: socket.IPPROTO_ICMPV6 # ICMPv6
-}
-ICMP_TYPE = {
-	4: slice(20, 21), # ICMPv4 type field
-	6: slice(0, 1) # ICMPv6 type field
-}
-ICMP_ECHO_REQUEST = {
-	4: b'\x08\x00\xf7\xfe\x00\x00\x00\x01', # ICMPv4 echo request
-	6: b'\x80\x00\x7f\xfe\x00\x00\x00\x01' # ICMPv6 echo request
-}
-ICMP_ECHO_REPLY = {
-	4: b'\x00', # ICMPv4 echo reply
-	6: b'\x81' # ICMPv6 echo reply
-}
-SOCKET_TYPE = socket.SOCK_RAW | socket.SOCK_NONBLOCK # Non blocking raw socket
-
-# Ping a host
-async def ping( destination ):
-	# Get asyncio event loop
-	loop = asyncio.get_event_loop()
-	# Get IP version
-	ip_version = ipaddress.ip_address( destination ).version
-	# Catch errors
+# Start the next update before the end of the previous one
+OVERLAP = False
+# Maximum number of probes in flight
+MAX_INFLIGHT = 1000
+
+# History of the test results (disabled by default)
+HISTORY = None
+
+# Test all areas, yield each result as soon as it is received
+# ( area, address, port, result, latency statistics )
+async def test_all_areas( slots ):
+	# Run a test when a slot is free (shared by the overlapping updates), return its result with its target
+	async def test( area, address, port, service ):
+		async with slots: _, result, latency = await test_host( address, port, service )
+		return area, address, port, result, latency
+	# Start all the tests of the probe plan
+	tasks = [ asyncio.create_task( test( *probe ) ) for probe in PLAN.probes ]
+	# Yield the results as they are received
 	try:
-		# Create network socket
-		with socket.socket( IP_FAMILY[ip_version], SOCKET_TYPE, IP_PROTO[ip_version] ) as icmp_socket:
-			# Connect the socket
-			await loop.sock_connect( icmp_socket, (destination, None) )
-			# Send ping request
-			await loop.sock_sendall( icmp_socket, ICMP_ECHO_REQUEST[ip_version] )
-			# Get reply
-			reply = await asyncio.wait_for( loop.sock_recv(icmp_socket, 1024), timeout=TIMEOUT )
-	# Connection failed
-	except OSError: return False
-	# Check reply
-	else: return True if reply[ICMP_TYPE[ip_version]] == ICMP_ECHO_REPLY[ip_version] else False
-
-# Connect to a TCP service
-async def connect( address, port ):
-	# Initiate a connection
-	try: _, writer = await asyncio.wait_for( asyncio.open_connection(host=address, port=port), timeout=TIMEOUT )
-	# Connection failed
-	except OSError: return False
-	# Connection done
-	else: writer.close(); return True
-
-# Test a host (TCP service or ping)
-async def test_host( address, port ):
-	# Test TCP service
-	if port: result = await connect( address, port )
-	# Test ping
-	else: result = await ping( address )
-	# Return test result
-	return ( port, result )
-
-# Test one area
-async def test_one_area( area ):
-	# Modify the destination addresses according to the area number
-	ipv4_destination = IPV4_ADDRESS.format( area=area )
-	ipv6_destination = IPV6_ADDRESS.format( area=area )
-	# Create a task group
-	async with asyncio.TaskGroup() as task_group:
-		# Do all the tests for this area
-		tasks = [ task_group.create_task( test_host( address, port ) )
-			for address in [ ipv4_destination, ipv6_destination ]
-			for port in [ *PROTOCOLS.keys() ] ]
-	# Return the results of the tasks for this area
-	return [ task.result() for task in tasks ]
-
-# Test all areas
-async def test_all_areas():
-	# Create a task group
-	async with asyncio.TaskGroup() as task_group:
-		# Test all areas
-		tasks = [ task_group.create_task( test_one_area(i+1) ) for i in range( AREA_NUMBER ) ]
-	# Return the results of the tasks for each area
-	return [ task.result() for task in tasks ]
-
-# Format the test result for display
+		for next_result in asyncio.as_completed( tasks ): yield await next_result
+	# Cancel the remaining tests if stopped
+	finally:
+		for task in tasks: task.cancel()
+
+# Format the test result for display (None for a pending test)
 def output( test ):
-	return f'{'\033[42m' if test[1] else '\033[41m'} {PROTOCOLS[test[0]]} \033[0m'
+	return f'{'\033[100m' if test[1] is None else '\033[42m' if test[1] else '\033[41m'} {SERVICES[test[0]]} \033[0m'
+
+# Format the latency statistics of one address for display
+# Ping min/avg/max/jitter and loss, average service check time, check details
+def output_latency( results ):
+	summaries = { port: latency.summary() for port, _, latency in results }
+	details = [ latency.details for _, _, latency in results if latency.details ]
+	# Ping statistics
+	minimum, average, maximum, jitter, loss = summaries.get( 0, ( None, None, None, None, 0 ) )
+	text = '' if 0 not in summaries else f'rtt {minimum:.2f}/{average:.2f}/{maximum:.2f}/{jitter:.2f} ms {loss:.0f} %' if average is not None else f'rtt - {loss:.0f} %'
+	# Service check time
+	averages = [ summary[1] for port, summary in summaries.items() if port and summary[1] is not None ]
+	if averages: text += f'  svc {statistics.fmean( averages ):.2f} ms'
+	# Service check details (certificate expiry)
+	if details: text += '  ' + '  '.join( details )
+	return text.strip()
+
+# Screen line of the first area
+FIRST_LINE = 6
+# Screen layout of the tested areas and protocols, computed when the screen is printed
+SCREEN = {}
+# Last results by area and IP version
+RESULTS = {}
+
+# Move the cursor to a line and a column of the screen
+def move( line, column ):
+	return f'\033[{line};{column}H'
+
+# Print the screen with the pending results
+def draw():
+	# Screen layout of the tested protocols
+	protocol_display = sum( len( SERVICES[port] ) + 3 for port in PLAN.ports ) - 9
+	# Screen column of the IPv4 and IPv6 results
+	SCREEN['column'] = { 4: 16, 6: 16 + protocol_display + 13 }
+	# Width of the results of one address
+	SCREEN['width'] = protocol_display + 9
+	# Position of each protocol in the results of one address
+	SCREEN['protocol'] = dict( zip( PLAN.ports, itertools.accumulate( ( len( SERVICES[port] ) + 3 for port in PLAN.ports ), initial=0 ) ) )
+	# Screen line of each area
+	SCREEN['line'] = { area: FIRST_LINE + 2 * i for i, area in enumerate( PLAN.areas ) }
+	# Clear screen and print the header
+	print( '\033[H\033[J\nIUT RT Auxerre - Network Lab Monitoring\n' )
+	print( '  -- Area --   -- IPv4 ' + '-'*protocol_display + '    -- IPv6 ' + '-'*protocol_display + '\n' )
+	# Print the pending results of all the areas (blank for the protocols not tested)
+	for area, versions in PLAN.areas.items():
+		print( f'      {area:<9}' + '    '.join( ' '.join( output( ( port, None ) ) if port in versions.get( version, ( None, () ) )[1]
+			else ' ' * ( len( SERVICES[port] ) + 2 ) for port in PLAN.ports ) for version in ( 4, 6 ) ) + '\n' )
+	print( '\nLatency : rtt = ping min/avg/max/jitter (ms) and loss, svc = service check time (ms)' )
+
+# Screen line of the status message, under the results
+def status_line():
+	return FIRST_LINE + 2 * len( PLAN.areas ) + 3
+
+# Print a status message
+def status( message ):
+	print( move( status_line(), 1 ) + message + '\033[K' + move( status_line() + 1, 1 ), end='', flush=True )
+
+# Print a test result and the latencies of its address at their place on the screen
+def show( area, address, port, result, latency ):
+	# Skip the result of a target removed by an inventory reload
+	if port not in PLAN.areas.get( area, {} ).get( address.version, ( None, () ) )[1]: return
+	# Save the result
+	results = RESULTS.setdefault( ( area, address.version ), {} )
+	results[ port ] = ( port, result, latency )
+	# Get the position of the results of the address
+	line = SCREEN['line'][area]
+	column = SCREEN['column'][address.version]
+	# Print the result and the latencies, then move the cursor under the status message
+	print( move( line, column + SCREEN['protocol'][port] ) + output( ( port, result ) )
+		+ move( line + 1, column ) + output_latency( results.values() ).ljust( SCREEN['width'] )[:SCREEN['width']]
+		+ move( status_line() + 1, 1 ), end='', flush=True )
+
+# Run the tests of one update, and print the results as they are received
+async def update( slots ):
+	start_time = time.monotonic()
+	status( 'Updating...' )
+	async for test in test_all_areas( slots ):
+		show( *test )
+		if HISTORY: HISTORY.record( *test )
+	status( f'Last updated on {time.strftime('%X')} in {time.monotonic() - start_time:.1f} s' )
+
+# Reload the inventory (SIGHUP), and print the screen of the new probe plan
+def reload():
+	error = PLAN.load()
+	if error: return status( f'Inventory not reloaded : {error}' )
+	RESULTS.clear()
+	draw()
 
-# Monitoring application
+# Monitoring application
 async def main():
+	# Print the screen
+	draw()
+	# Reload the inventory on SIGHUP, without stopping the updates
+	asyncio.get_running_loop().add_signal_handler( signal.SIGHUP, reload )
+	# Updates running in the background (overlapping updates)
+	updates = set()
+	# Free slots for the probes in flight, shared by all the updates
+	slots = asyncio.Semaphore( MAX_INFLIGHT )
 	# Start monitoring
 	while True:
-		# Run the tests
-		print( '\nUpdating...\n' )
-		tests = await test_all_areas()
-		# Clear screen and print results
-		print( '\033[H\033[J\nIUT RT Auxerre - Network Lab Monitoring\n' )
-		print( '  -- Area --   -- IPv4 ' + '-'*PROTOCOL_DISPLAY + '    -- IPv6 ' + '-'*PROTOCOL_DISPLAY + '\n' )
-		for area, results in enumerate( tests ):
-			# Print results for one area
-			print( f'      {area + 1}        '
-				+ ' '.join( output(test) for test in results[:PROTOCOL_NUMBER] )
-				+ '    '
-				+ ' '.join( output(test) for test in results[PROTOCOL_NUMBER:] )
-			)
-		# Update time
-		print( f'\nLast updated on {time.strftime('%X')}' )
-		# Wait for next update
-		await asyncio.sleep( INTERVAL )
+		# Run the tests
+		start_time = time.monotonic()
+		task = asyncio.create_task( update( slots ) )
+		# Wait for the end of the update, or let it run with the next one
+		if not OVERLAP: await task
+		else: updates.add( task ); task.add_done_callback( updates.discard )
+		# Wait for next update, at a fixed interval
+		await asyncio.sleep( max( start_time + INTERVAL - time.monotonic(), 0 ) )
 
 # Main application
 if __name__ == '__main__':
 	# Command line parameters
 	parser = argparse.ArgumentParser( description='Network Lab Monitoring Application', formatter_class=argparse.ArgumentDefaultsHelpFormatter )
-	parser.add_argument( '-n', '--number', type=int, default=AREA_NUMBER, help=f'Area number' )
+	parser.add_argument( '-n', '--number', type=int, default=lab_monitor.AREA_NUMBER, help=f'Area number' )
 	parser.add_argument( '-i', '--interval', type=int, default=INTERVAL, help=f'Refresh interval' )
-	parser.add_argument( '-t', '--timeout', type=int, default=TIMEOUT, help=f'Network test timeout' )
-	parser.add_argument( '-4', '--destination4', default=IPV4_ADDRESS, help=f'IPv4 destination address' )
-	parser.add_argument( '-6', '--destination6', default=IPV6_ADDRESS, help=f'IPv6 destination address' )
+	parser.add_argument( '-c', '--count', type=int, default=lab_monitor.PING_COUNT, help='Number of pings per update' )
+	parser.add_argument( '-s', '--samples', type=int, default=lab_monitor.SAMPLES, help='Number of latency samples kept per target' )
+	parser.add_argument( '-t', '--timeout', type=int, default=lab_monitor.TIMEOUT, help=f'Network test timeout' )
+	parser.add_argument( '-m', '--max-inflight', type=int, default=MAX_INFLIGHT, help='Maximum number of probes in flight' )
+	parser.add_argument( '-o', '--overlap', action='store_true', help='Start the next update before the end of the previous one' )
+	parser.add_argument( '--history', help='Save the test results in this SQLite database' )
+	parser.add_argument( '--history-days', type=float, default=30, help='Number of days kept in the history (0 for no limit)' )
+	parser.add_argument( '--history-rows', type=int, default=10000000, help='Number of results kept in the history (0 for no limit)' )
+	parser.add_argument( '-4', '--destination4', default=lab_monitor.IPV4_ADDRESS, help=f'IPv4 destination address' )
+	parser.add_argument( '-6', '--destination6', default=lab_monitor.IPV6_ADDRESS, help=f'IPv6 destination address' )
+	parser.add_argument( '--inventory', help='Target inventory file (TOML), instead of the area number and the destination addresses (reloaded on SIGHUP)' )
 	args = parser.parse_args()
-	# Check if root
-	if os.geteuid() != 0: print( '\n-> Run this application as root (sudo)...'); exit()
+	# Test the TCP services only if ping is not available
+	if not ping_available():
+		print( '\n-> Ping disabled, run this application as root (sudo) or allow the ping sockets (sysctl net.ipv4.ping_group_range)...' )
+		lab_monitor.PING = False
+		time.sleep( 2 )
 	# Get area number
-	AREA_NUMBER = args.number
+	lab_monitor.AREA_NUMBER = args.number
 	# Get destination IP addresses
-	IPV4_ADDRESS = args.destination4
-	IPV6_ADDRESS = args.destination6
+	lab_monitor.IPV4_ADDRESS = args.destination4
+	lab_monitor.IPV6_ADDRESS = args.destination6
+	# Get target inventory file
+	lab_monitor.INVENTORY = args.inventory
 	# Get update interval parameter
 	INTERVAL = args.interval
 	# Get timeout parameter
-	TIMEOUT = args.timeout
+	lab_monitor.TIMEOUT = args.timeout
+	# Get latency measurement parameters
+	lab_monitor.PING_COUNT = args.count
+	lab_monitor.SAMPLES = args.samples
+	# Get overlapping updates parameter
+	OVERLAP = args.overlap
+	# Get the maximum number of probes in flight
+	MAX_INFLIGHT = args.max_inflight
+	# Raise the open file limit for the probes in flight
+	soft_limit, hard_limit = resource.getrlimit( resource.RLIMIT_NOFILE )
+	file_limit = MAX_INFLIGHT + 64 if hard_limit == resource.RLIM_INFINITY else min( MAX_INFLIGHT + 64, hard_limit )
+	if soft_limit < file_limit: resource.setrlimit( resource.RLIMIT_NOFILE, ( file_limit, hard_limit ) )
+	# Compile the probe plan
+	error = PLAN.load()
+	if error: print( f'\n-> Invalid inventory : {error}\n' ); exit()
+	# Create the history of the test results
+	if args.history: HISTORY = History( args.history, args.history_days, args.history_rows )
+	# Start the history writer
+	if HISTORY: HISTORY.start()
 	# Run the monitoring application
 	try: asyncio.run( main() )
 	# Ctrl+C to stop the application
-	except KeyboardInterrupt: print( '\n' )
\ No newline at end of file
+	except KeyboardInterrupt: print( '\n' )
+	# Write the last results to the history
+	if HISTORY: HISTORY.stop()
\ No newline at end of file
@@ -0,0 +1,193 @@
+#! /usr/bin/env python
+
+#
+# Web Server Load Generator (HTTP + HTTPS with IPv4 + IPv6)
+# https://github.com/microy/rt-auxerre
+# Copyright (c) 2026 Michaël Roy
+# usage : $ ./web-bench.py
+#
+
+# Dependencies
+import argparse
+import asyncio
+import itertools
+import re
+import ssl
+import statistics
+import time
+from collections import Counter
+
+# Server IP addresses
+IPV4_ADDRESS = '127.0.0.1'
+IPV6_ADDRESS = '::1'
+# Number of concurrent connections per target
+CONNECTIONS = 16
+# Duration of the test
+DURATION = 5
+# Number of requests per target (0 for a test during DURATION)
+REQUESTS = 0
+# Request timeout
+TIMEOUT = 5
+# Delay before opening a new connection after a connection failure
+RETRY_DELAY = 0.1
+# Requested path
+PATH = '/'
+# Check the web page returned by the server
+CHECK = False
+# Server port by web protocol
+PORTS = {
+	'HTTP': 80,
+	'HTTPS': 443
+}
+
+# TLS context accepting the self-signed certificate of the server
+SSL_CONTEXT = ssl.create_default_context()
+SSL_CONTEXT.check_hostname = False
+SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+
+# Results of one target (IP version + web protocol)
+class Results:
+	# Initialisation
+	def __init__( self ):
+		self.latencies = []
+		self.errors = Counter()
+	# Merge the results of several targets
+	@classmethod
+	def merge( cls, results ):
+		merged = cls()
+		for result in results:
+			merged.latencies += result.latencies
+			merged.errors += result.errors
+		return merged
+	# Latency percentiles in milliseconds
+	def percentiles( self ):
+		if len( self.latencies ) < 2: return [ 1000 * latency for latency in self.latencies * 3 ] or [ 0, 0, 0 ]
+		quantiles = statistics.quantiles( self.latencies, n=100, method='inclusive' )
+		return [ 1000 * quantiles[i] for i in ( 49, 89, 98 ) ]
+
+# Read a response, return the status code, the headers and the body
+async def read_response( reader ):
+	headers = await reader.readuntil( b'\r\n\r\n' )
+	length = re.search( rb'(?i)content-length: *(\d+)', headers )
+	body = await reader.readexactly( int( length.group(1) ) ) if length else b''
+	return int( headers.split( maxsplit=2 )[1] ), headers, body
+
+# Check the web page sent by the server (do_GET)
+def check_body( body, web_protocol, client_address ):
+	return ( b'IUT RT Auxerre - Web Server' in body
+		and f'<code>{web_protocol}</code>'.encode() in body
+		and f'<code>{client_address}</code>'.encode() in body )
+
+# Send requests until the deadline or the request budget is reached
+async def client( address, web_protocol, keep_alive, deadline, budget, results ):
+	# Request, with the IPv6 address between brackets in the Host header
+	host = f'[{address}]' if ':' in address else address
+	request = f'GET {PATH} HTTP/1.1\r\nHost: {host}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n'.encode()
+	writer = None
+	while time.monotonic() < deadline and ( not REQUESTS or next( budget ) < REQUESTS ):
+		start_time = time.perf_counter()
+		try:
+			# Open a connection if necessary
+			if writer is None:
+				reader, writer = await asyncio.wait_for( asyncio.open_connection( address, PORTS[web_protocol],
+					ssl=SSL_CONTEXT if web_protocol == 'HTTPS' else None ), timeout=TIMEOUT )
+				client_address = writer.get_extra_info( 'sockname' )[0].removeprefix( '::ffff:' )
+			# Send the request and read the response
+			writer.write( request )
+			status, headers, body = await asyncio.wait_for( read_response( reader ), timeout=TIMEOUT )
+		# Connection failed, or invalid response
+		except ( OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, TimeoutError, ValueError, IndexError ) as error:
+			results.errors[ type( error ).__name__ ] += 1
+			# Close the connection, or wait before retrying if it could not be opened (server down)
+			if writer: writer.close()
+			else: await asyncio.sleep( RETRY_DELAY )
+			writer = None
+			continue
+		# Save the latency
+		results.latencies.append( time.perf_counter() - start_time )
+		# Check the response
+		if status != 200: results.errors[ f'HTTP {status}' ] += 1
+		elif CHECK and not check_body( body, web_protocol, client_address ): results.errors[ 'Bad page' ] += 1
+		# Close the connection if necessary
+		if not keep_alive or b'connection: close' in headers.lower():
+			writer.close()
+			writer = None
+	# Close the connection
+	if writer: writer.close()
+
+# Load all the targets at the same time, return the results and the test duration
+async def load( targets, keep_alive ):
+	results = { target: Results() for target in targets }
+	deadline = time.monotonic() + ( DURATION if not REQUESTS else float( 'inf' ) )
+	start_time = time.monotonic()
+	async with asyncio.TaskGroup() as task_group:
+		for ( address, web_protocol ), result in results.items():
+			budget = itertools.count()
+			for _ in range( CONNECTIONS ):
+				task_group.create_task( client( address, web_protocol, keep_alive, deadline, budget, result ) )
+	return results, time.monotonic() - start_time
+
+# Format the results of one target for display
+def output( name, results, duration ):
+	p50, p90, p99 = results.percentiles()
+	return ( f'   {name:12}  {len( results.latencies ):10}  {sum( results.errors.values() ):8}  {len( results.latencies ) / duration:12.1f}'
+		f'  {p50:8.2f}  {p90:8.2f}  {p99:8.2f}' )
+
+# Load generator application
+async def main( targets, keep_alive, compare ):
+	print( f'\nIUT RT Auxerre - Web Server Load Generator ( {CONNECTIONS} connections per target, '
+		f'{f'{REQUESTS} requests' if REQUESTS else f'{DURATION} s'} )\n' )
+	print( '  -- Target --   -- Requests --  -- Errors --  -- Requests/s --  -- p50 / p90 / p99 (ms) --\n' )
+	# Compare keep-alive on and off, one target after the other
+	if compare:
+		for target in targets:
+			for keep_alive in ( True, False ):
+				results, duration = await load( [ target ], keep_alive )
+				print( output( f'{targets[target]} {'on' if keep_alive else 'off'}', results[target], duration ) )
+		return print()
+	# Load all the targets together
+	results, duration = await load( targets, keep_alive )
+	for target, result in results.items():
+		print( output( targets[target], result, duration ) )
+	print( '\n' + output( 'Total', Results.merge( results.values() ), duration ) )
+	# Error details
+	errors = Results.merge( results.values() ).errors
+	if errors: print( '\nErrors : ' + ', '.join( f'{error} ( {count} )' for error, count in errors.most_common() ) )
+	print()
+
+# Main application
+if __name__ == '__main__':
+	# Command line parameters
+	parser = argparse.ArgumentParser( description='Web Server Load Generator', formatter_class=argparse.ArgumentDefaultsHelpFormatter )
+	parser.add_argument( '-c', '--connections', type=int, default=CONNECTIONS, help='Number of concurrent connections per target' )
+	parser.add_argument( '-d', '--duration', type=int, default=DURATION, help='Test duration' )
+	parser.add_argument( '-n', '--requests', type=int, default=REQUESTS, help='Number of requests per target, instead of a test duration' )
+	parser.add_argument( '-t', '--timeout', type=int, default=TIMEOUT, help='Request timeout' )
+	parser.add_argument( '-4', '--destination4', default=IPV4_ADDRESS, help='IPv4 server address' )
+	parser.add_argument( '-6', '--destination6', default=IPV6_ADDRESS, help='IPv6 server address' )
+	parser.add_argument( '-p', '--path', default=PATH, help='Requested path' )
+	parser.add_argument( '--ipv4', action='store_true', help='Test IPv4 only' )
+	parser.add_argument( '--ipv6', action='store_true', help='Test IPv6 only' )
+	parser.add_argument( '--http', action='store_true', help='Test HTTP only' )
+	parser.add_argument( '--https', action='store_true', help='Test HTTPS only' )
+	parser.add_argument( '--no-keepalive', action='store_true', help='One connection per request' )
+	parser.add_argument( '--compare', action='store_true', help='Compare keep-alive on and off for each target' )
+	parser.add_argument( '--check', action='store_true', help='Check the web page sent by the server' )
+	args = parser.parse_args()
+	# Get the test parameters
+	CONNECTIONS = args.connections
+	DURATION = args.duration
+	REQUESTS = args.requests
+	TIMEOUT = args.timeout
+	PATH = args.path
+	CHECK = args.check
+	# Get the targets (IPv4 and IPv6, HTTP and HTTPS by default)
+	addresses = { 'IPv4': args.destination4, 'IPv6': args.destination6 }
+	if args.ipv4 != args.ipv6: del addresses[ 'IPv6' if args.ipv4 else 'IPv4' ]
+	protocols = [ 'HTTP', 'HTTPS' ]
+	if args.http != args.https: protocols.remove( 'HTTPS' if args.http else 'HTTP' )
+	targets = { ( address, web_protocol ): f'{name} {web_protocol}' for name, address in addresses.items() for web_protocol in protocols }
+	# Run the load generator
+	try: asyncio.run( main( targets, not args.no_keepalive, args.compare ) )
+	# Ctrl+C to stop the application
+	except KeyboardInterrupt: print( '\n' )
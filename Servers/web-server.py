@@ -11,20 +11,66 @@
 # Required external dependency :
 #	openssl
 #
+# Optional external dependency :
+#	brotli ( pip install brotli )
+#
 
 # External modules
+import argparse
+import asyncio
+import bisect
+import gzip
+import json
+import mimetypes
 import os
 import platform
+import queue
+import random
 import re
 import signal
 import socket
+import socketserver
+import ssl
+import stat
 import subprocess
 import sys
-import tempfile
 import threading
+import time
+import traceback
+import urllib.parse
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from email.utils import formatdate
 from http import HTTPStatus
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer, ThreadingHTTPSServer
 
+# Brotli compression if available
+try : import brotli
+except ImportError : brotli = None
+
+# Command line parameters
+parser = argparse.ArgumentParser( description='Web Server Application', formatter_class=argparse.ArgumentDefaultsHelpFormatter )
+parser.add_argument( '--no-cache', action='store_true', help='Disable the response cache' )
+parser.add_argument( '--cache-size', type=int, default=1024, help='Maximum number of cached responses' )
+parser.add_argument( '--engine', choices=[ 'thread', 'asyncio' ], default='thread', help='Server engine' )
+parser.add_argument( '--max-connections', type=int, default=1024, help='Maximum number of concurrent connections (asyncio engine)' )
+parser.add_argument( '--keepalive-timeout', type=float, default=5, help='Idle time before closing a persistent connection (seconds)' )
+parser.add_argument( '--max-requests', type=int, default=100, help='Maximum number of requests per persistent connection' )
+parser.add_argument( '--workers', type=int, default=1, help='Number of server processes sharing the ports (SO_REUSEPORT, without /metrics)' )
+parser.add_argument( '--cert-dir', default='/var/cache/rt-auxerre', help='Directory of the cached TLS certificate and key' )
+parser.add_argument( '--key-type', choices=[ 'rsa', 'ecdsa' ], default='rsa', help='TLS key type (ECDSA P-256 for faster handshakes)' )
+parser.add_argument( '--bench-tls', action='store_true', help='Benchmark the full and resumed TLS handshakes, then exit' )
+parser.add_argument( '--root', help='Serve the files of this directory instead of the web page' )
+parser.add_argument( '--file-cache-size', type=int, default=65536, help='Maximum size of a file kept in memory (bytes)' )
+parser.add_argument( '--no-compression', action='store_true', help='Disable the gzip and brotli compression of the responses' )
+parser.add_argument( '--compress-min-size', type=int, default=256, help='Minimum size of a compressed response body (bytes)' )
+parser.add_argument( '--access-log', help='Access log file, one file per worker process (default: console)' )
+parser.add_argument( '--log-format', choices=[ 'text', 'json' ], default='text', help='Access log format' )
+parser.add_argument( '--log-sample', type=float, default=1.0, help='Fraction of the requests written to the access log' )
+parser.add_argument( '--log-max-bytes', type=int, default=10485760, help='Access log file size before rotation' )
+parser.add_argument( '--log-backups', type=int, default=5, help='Number of rotated access log files' )
+args = parser.parse_args()
+
 # Check if root
 if os.geteuid() != 0 :
 	print( '\n-> Run this application as root (sudo)...')
@@ -62,71 +108,694 @@ PROTOCOL = {
 def CLEANUP_ADDRESS( ip_address ) :
 	return re.sub( r'^::ffff:', '', ip_address )
 
-# Generate temporary files for the server TLS certificate and key
-CERTFILE = tempfile.NamedTemporaryFile()
-KEYFILE = tempfile.NamedTemporaryFile()
+# Get the server address from the Host header
+# Remove the brackets around an IPv6 address
+def get_host( host, default ) :
+	# No Host header (HTTP/1.0 client)
+	if not host : return default
+	# IPv6 address
+	if host.startswith( '[' ) : return host[ 1 : host.find( ']' ) ]
+	# IPv4 address or host name
+	return host
+
+# Compression functions, from the preferred to the least preferred encoding
+COMPRESSORS = {}
+if not args.no_compression :
+	if brotli : COMPRESSORS[ 'br' ] = lambda data : brotli.compress( data, quality=11 )
+	COMPRESSORS[ 'gzip' ] = lambda data : gzip.compress( data, compresslevel=9, mtime=0 )
+
+# Choose the response encoding from the Accept-Encoding header (None for no compression)
+def get_encoding( accept_encoding ) :
+	# Get the encodings accepted by the client, with their quality value
+	accepted = {}
+	for item in accept_encoding.lower().split( ',' ) :
+		name, _, parameters = item.partition( ';' )
+		# Quality value 1 by default, and 0 if invalid
+		quality = re.fullmatch( r'\s*q\s*=\s*(0(\.\d{0,3})?|1(\.0{0,3})?)\s*', parameters )
+		accepted[ name.strip() ] = float( quality.group( 1 ) ) if quality else 0.0 if parameters.strip() else 1.0
+	# Get the preferred encoding
+	for encoding in COMPRESSORS :
+		if accepted.get( encoding, accepted.get( '*', 0 ) ) > 0 : return encoding
+	return None
+
+# Compress a response body
+def compress( body, encoding ) :
+	return COMPRESSORS[ encoding ]( body )
+
+# Encode a response body, return the response (headers + body) and the compression ratio
+def encode_body( headers, body, encoding ) :
+	ratio = None
+	# Compress the bodies large enough
+	if COMPRESSORS and len( body ) >= args.compress_min_size :
+		headers += 'Vary: Accept-Encoding\r\n'
+		# Get the precompressed body from the cache, and keep it only if smaller
+		if encoding :
+			compressed_body = COMPRESSION_CACHE.get( ( body, encoding ), compress )
+			if len( compressed_body ) < len( body ) :
+				headers += f'Content-Encoding: {encoding}\r\n'
+				ratio = len( body ) / len( compressed_body )
+				body = compressed_body
+	return bytes( headers + f'Content-Length: {len( body )}\r\n\r\n', 'latin-1' ) + body, ratio
+
+# Build the web page response (headers + body) and its compression ratio
+def build_page( host, server_ip_address, web_protocol, client_ip_address, encoding ) :
+	# Show the external server address if different
+	if server_ip_address != host :
+		server_ip_address = f'{host} ({server_ip_address})'
+	# Render the web page
+	body = bytes( WEBPAGE.format( server_ip_address, web_protocol, client_ip_address ), 'utf-8' )
+	# Prebuild the headers, and compress the body
+	return encode_body( 'Content-type: text/html\r\n', body, encoding )
+
+# Response cache with LRU eviction
+class ResponseCache :
+	# Initialisation
+	def __init__( self, size ) :
+		# Maximum number of responses (0 to disable the cache)
+		self.size = size
+		# Cached responses, from the least to the most recently used
+		self.responses = OrderedDict()
+		self.lock = threading.Lock()
+		# Statistics
+		self.hits = 0
+		self.misses = 0
+	# Get a response from the cache, or build it
+	def get( self, key, build ) :
+		with self.lock :
+			response = self.responses.get( key )
+			# Cache hit
+			if response is not None :
+				self.responses.move_to_end( key )
+				self.hits += 1
+				return response
+			# Cache miss
+			self.misses += 1
+		# Build the response outside the lock
+		response = build( *key )
+		# Store the response and evict the least recently used one
+		if self.size :
+			with self.lock :
+				self.responses[ key ] = response
+				if len( self.responses ) > self.size : self.responses.popitem( last=False )
+		return response
+	# Cache statistics
+	def stats( self ) :
+		total = self.hits + self.misses
+		return f'{self.hits} hits / {self.misses} misses ( {100 * self.hits / total if total else 0:.1f} % hit rate )'
+
+# Create the response cache
+RESPONSE_CACHE = ResponseCache( 0 if args.no_cache else args.cache_size )
+
+# Create the cache of the compressed bodies, keyed by body and encoding
+COMPRESSION_CACHE = ResponseCache( 0 if args.no_cache else args.cache_size )
+
+# Root directory of the served files
+ROOT = os.path.realpath( args.root ) if args.root else None
+
+# Create the cache for the small files, keyed by path and modification time
+FILE_CACHE = ResponseCache( 0 if args.no_cache else args.cache_size )
+
+# Read a file
+def read_file( file, mtime, size ) :
+	with open( file, 'rb' ) as f : return f.read()
+
+# Get the content of a small file from the cache (None for a large file)
+def get_small_file( file, file_stat ) :
+	if file_stat.st_size > args.file_cache_size : return None
+	return FILE_CACHE.get( ( file, file_stat.st_mtime_ns, file_stat.st_size ), read_file )
+
+# Compressible file types
+COMPRESSIBLE = re.compile( r'text/.*|application/(json|javascript|xml|xhtml\+xml)|image/svg\+xml' )
+
+# Prepare the response for a file of the root directory (conditional, range and compressed requests)
+# Return the status code, the headers, the file and its status, the byte range to send, and the compression ratio
+# A compressed file is returned with the headers (no byte range to send)
+def prepare_file( path, headers, encoding ) :
+	# Get the file path, and forbid the paths outside the root directory (or with a null character)
+	try :
+		file = os.path.realpath( os.path.join( ROOT, urllib.parse.unquote( urllib.parse.urlsplit( path ).path ).lstrip( '/' ) ) )
+		if os.path.isdir( file ) : file = os.path.join( file, 'index.html' )
+		file_stat = os.stat( file ) if os.path.commonpath( [ ROOT, file ] ) == ROOT else None
+	except ( OSError, ValueError ) : file_stat = None
+	# File not found
+	if file_stat is None or not stat.S_ISREG( file_stat.st_mode ) :
+		return HTTPStatus.NOT_FOUND, b'Content-Length: 0\r\n\r\n', None, None, 0, 0, None
+	# File headers
+	size = file_stat.st_size
+	content_type = mimetypes.guess_type( file )[0] or 'application/octet-stream'
+	# Compress the small text files (not the range requests)
+	compressible = ( COMPRESSORS and COMPRESSIBLE.fullmatch( content_type ) and not headers.get( 'range' )
+		and args.compress_min_size <= size <= args.file_cache_size )
+	if not compressible : encoding = None
+	# One entity tag per encoding
+	etag = f'"{file_stat.st_mtime_ns:x}-{size:x}{f'-{encoding}' if encoding else ''}"'
+	response = ( f'Content-type: {content_type}\r\nETag: {etag}\r\n'
+		f'Last-Modified: {formatdate( file_stat.st_mtime, usegmt=True )}\r\nAccept-Ranges: bytes\r\n' )
+	# File not modified
+	if_none_match = headers.get( 'if-none-match', '' )
+	if if_none_match == '*' or etag in if_none_match :
+		if compressible : response += 'Vary: Accept-Encoding\r\n'
+		return HTTPStatus.NOT_MODIFIED, bytes( response + '\r\n', 'latin-1' ), file, file_stat, 0, 0, None
+	# Compressed file
+	if compressible :
+		response, ratio = encode_body( response, get_small_file( file, file_stat ), encoding )
+		return HTTPStatus.OK, response, None, None, 0, 0, ratio
+	# Send the whole file by default
+	code, offset, length = HTTPStatus.OK, 0, size
+	# Single byte range
+	byte_range = re.fullmatch( r'bytes=(\d*)-(\d*)', headers.get( 'range', '' ).strip() )
+	if byte_range and any( byte_range.groups() ) :
+		start, end = byte_range.groups()
+		# Last bytes of the file
+		if not start : start, end = max( size - int( end ), 0 ), size - 1
+		else : start, end = int( start ), min( int( end ) if end else size - 1, size - 1 )
+		# Range not satisfiable
+		if start >= size :
+			return HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, bytes( f'Content-Range: bytes */{size}\r\nContent-Length: 0\r\n\r\n', 'latin-1' ), None, None, 0, 0, None
+		# Partial content (an invalid range is ignored)
+		if start <= end :
+			code, offset, length = HTTPStatus.PARTIAL_CONTENT, start, end - start + 1
+			response += f'Content-Range: bytes {start}-{end}/{size}\r\n'
+	return code, bytes( response + f'Content-Length: {length}\r\n\r\n', 'latin-1' ), file, file_stat, offset, length, None
+
+# TLS key parameters for openssl
+SSL_KEY = {
+	'rsa': 'rsa:2048', # RSA 2048 bits
+	'ecdsa': 'ec -pkeyopt ec_paramgen_curve:prime256v1' # ECDSA P-256
+}
+
+# Access log written in batches by a background thread
+class AccessLog :
+	# Initialisation
+	def __init__( self, filename, log_format, sample, max_bytes, backups ) :
+		# Log parameters
+		self.filename = filename
+		self.format = self.format_json if log_format == 'json' else self.format_text
+		self.sample = sample
+		self.max_bytes = max_bytes
+		self.backups = backups
+		# Records queued by the request handlers
+		self.records = queue.SimpleQueue()
+		self.thread = None
+	# Start the writer thread
+	def start( self ) :
+		# One log file per worker process
+		if self.filename and args.workers > 1 : self.filename = f'{self.filename}.{os.getpid()}'
+		self.file = open( self.filename, 'a' ) if self.filename else sys.stderr
+		self.thread = threading.Thread( target=self.run, daemon=True )
+		self.thread.start()
+	# Stop the writer thread, after writing the queued records
+	def stop( self ) :
+		if not self.thread : return
+		self.records.put( None )
+		self.thread.join()
+		if self.file is not sys.stderr : self.file.close()
+	# Queue a record of a request (sampled)
+	def log( self, client, server, protocol, method, path, status, size, latency, ratio=None ) :
+		if self.sample < 1 and random.random() >= self.sample : return
+		self.records.put( ( time.time(), client, server, protocol, method, path, int( status ), size, latency, ratio ) )
+	# Text record (console format, with the compression ratio of a compressed response)
+	def format_text( self, record ) :
+		return ( f'[ {time.strftime( '%d/%b/%Y %H:%M:%S', time.localtime( record[0] ) )} ] - Connexion from {record[1]} - ( {record[3]} )'
+			f'{f' - ( compression {record[9]:.1f}:1 )' if record[9] else ''}\n' )
+	# JSON record
+	def format_json( self, record ) :
+		return json.dumps( {
+			'time': datetime.fromtimestamp( record[0] ).astimezone().isoformat( timespec='milliseconds' ),
+			'client': record[1], 'server': record[2], 'protocol': record[3],
+			'method': record[4], 'path': record[5], 'status': record[6],
+			'bytes': record[7], 'latency_ms': round( record[8] * 1000, 3 ),
+			'compression_ratio': round( record[9], 2 ) if record[9] else None } ) + '\n'
+	# Write the queued records in batches
+	def run( self ) :
+		while True :
+			# Wait for a record, then get all the queued ones
+			batch = [ self.records.get() ]
+			while len( batch ) < 4096 :
+				try : batch.append( self.records.get_nowait() )
+				except queue.Empty : break
+			# Write and flush the batch
+			stop = None in batch
+			self.write( ''.join( self.format( record ) for record in batch if record ) )
+			if stop : return
+	# Write to the log file, and rotate it if necessary
+	def write( self, lines ) :
+		if self.file is not sys.stderr and self.max_bytes and self.file.tell() + len( lines ) > self.max_bytes : self.rotate()
+		self.file.write( lines )
+		self.file.flush()
+	# Rotate the log files (access.log -> access.log.1 -> access.log.2 ...)
+	def rotate( self ) :
+		self.file.close()
+		for i in range( self.backups - 1, 0, -1 ) :
+			if os.path.exists( f'{self.filename}.{i}' ) : os.replace( f'{self.filename}.{i}', f'{self.filename}.{i + 1}' )
+		if self.backups : os.replace( self.filename, f'{self.filename}.1' )
+		self.file = open( self.filename, 'w' )
+
+# Create the access log
+ACCESS_LOG = AccessLog( args.access_log, args.log_format, args.log_sample, args.log_max_bytes, args.log_backups )
+
+# Prometheus metrics
+# The request handlers only append events to a deque (atomic, no lock),
+# which are aggregated when /metrics is scraped, or when too many events are pending
+class Metrics :
+	# Histogram buckets (seconds)
+	buckets = ( 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5 )
+	# Maximum number of pending events
+	max_events = 65536
+	# Initialisation
+	def __init__( self ) :
+		# Pending events
+		self.events = deque()
+		# Aggregated values
+		self.lock = threading.Lock()
+		self.requests = Counter()
+		self.connections = Counter()
+		self.histograms = {}
+	# Record a request, classified by protocol and IP version
+	def request( self, web_protocol, client_ip_address, latency ) :
+		self.record( ( 'request', ( web_protocol, 'IPv6' if ':' in CLEANUP_ADDRESS( client_ip_address ) else 'IPv4' ), latency ) )
+	# Record a connection opening (+1) or closing (-1)
+	def connection( self, web_protocol, delta ) :
+		self.record( ( 'connection', web_protocol, delta ) )
+	# Record a TLS handshake
+	def handshake( self, duration ) :
+		self.record( ( 'handshake', (), duration ) )
+	# Append an event
+	def record( self, event ) :
+		self.events.append( event )
+		# Aggregate the events if nobody scrapes the metrics
+		if len( self.events ) > self.max_events and self.lock.acquire( blocking=False ) :
+			try : self.aggregate()
+			finally : self.lock.release()
+	# Aggregate the pending events (with the lock)
+	def aggregate( self ) :
+		while self.events :
+			kind, labels, value = self.events.popleft()
+			if kind == 'connection' : self.connections[ labels ] += value
+			else :
+				if kind == 'request' : self.requests[ labels ] += 1
+				# Histogram : count per bucket, then total count and sum
+				histogram = self.histograms.setdefault( ( kind, labels ), [ 0 ] * ( len( self.buckets ) + 3 ) )
+				histogram[ bisect.bisect_left( self.buckets, value ) ] += 1
+				histogram[ -2 ] += 1
+				histogram[ -1 ] += value
+	# Format a histogram in the Prometheus text format
+	def format_histogram( self, name, labels, histogram ) :
+		lines, count = [], 0
+		for bucket, bucket_count in zip( [ *self.buckets, '+Inf' ], histogram ) :
+			count += bucket_count
+			lines.append( f'{name}_bucket{{{labels}{',' if labels else ''}le="{bucket}"}} {count}' )
+		labels = f'{{{labels}}}' if labels else ''
+		return lines + [ f'{name}_sum{labels} {histogram[ -1 ]}', f'{name}_count{labels} {histogram[ -2 ]}' ]
+	# Prometheus text response (headers + body)
+	def response( self ) :
+		with self.lock :
+			self.aggregate()
+			lines = [ '# HELP http_requests_total Number of HTTP requests.', '# TYPE http_requests_total counter' ]
+			lines += [ f'http_requests_total{{protocol="{protocol}",family="{family}"}} {count}' for ( protocol, family ), count in self.requests.items() ]
+			lines += [ '# HELP http_request_duration_seconds HTTP request latency.', '# TYPE http_request_duration_seconds histogram' ]
+			for ( kind, labels ), histogram in self.histograms.items() :
+				if kind == 'request' : lines += self.format_histogram( 'http_request_duration_seconds', f'protocol="{labels[0]}",family="{labels[1]}"', histogram )
+			lines += [ '# HELP http_active_connections Number of open connections.', '# TYPE http_active_connections gauge' ]
+			lines += [ f'http_active_connections{{protocol="{protocol}"}} {count}' for protocol, count in self.connections.items() ]
+			lines += [ '# HELP tls_handshake_duration_seconds TLS handshake duration.', '# TYPE tls_handshake_duration_seconds histogram' ]
+			if ( 'handshake', () ) in self.histograms : lines += self.format_histogram( 'tls_handshake_duration_seconds', '', self.histograms[ ( 'handshake', () ) ] )
+		lines += [ '# HELP http_response_cache_total Response cache lookups.', '# TYPE http_response_cache_total counter',
+			f'http_response_cache_total{{result="hit"}} {RESPONSE_CACHE.hits}', f'http_response_cache_total{{result="miss"}} {RESPONSE_CACHE.misses}' ]
+		body = bytes( '\n'.join( lines ) + '\n', 'utf-8' )
+		return bytes( f'Content-type: text/plain; version=0.0.4\r\nContent-Length: {len( body )}\r\n\r\n', 'latin-1' ) + body
+
+# Create the metrics
+METRICS = Metrics()
+# Path of the metrics, only served by a single process
+# (each worker process has its own counters, and a scrape reaches only one of them)
+METRICS_PATH = '/metrics' if args.workers == 1 else None
+
+# Cached files for the server TLS certificate and key
+os.makedirs( args.cert_dir, mode=0o700, exist_ok=True )
+CERTFILE = os.path.join( args.cert_dir, f'cert-{args.key_type}.pem' )
+KEYFILE = os.path.join( args.cert_dir, f'key-{args.key_type}.pem' )
 
-# Generate a TLS certificate and key
-SSLCOMMAND = f'openssl req -x509 -newkey rsa:2048 -noenc -days 365 -out {CERTFILE.name} -keyout {KEYFILE.name} -subj /CN=rt-auxerre.fr'
-subprocess.run( SSLCOMMAND.split(), capture_output=True )
+# Generate a TLS certificate and key if missing or expiring within a day
+SSLCHECK = f'openssl x509 -checkend 86400 -noout -in'.split() + [ CERTFILE ]
+if not os.path.exists( KEYFILE ) or subprocess.run( SSLCHECK, capture_output=True ).returncode :
+	SSLCOMMAND = f'openssl req -x509 -newkey {SSL_KEY[ args.key_type ]} -noenc -days 365 -subj /CN=rt-auxerre.fr'.split()
+	subprocess.run( SSLCOMMAND + [ '-out', CERTFILE, '-keyout', KEYFILE ], capture_output=True )
+
+# Create the TLS context shared by all the servers
+# Created before forking the workers, so they share the session ticket keys
+# The resumed handshakes use the session tickets and the server session cache, both enabled by OpenSSL by default
+SSL_CONTEXT = ssl.create_default_context( ssl.Purpose.CLIENT_AUTH )
+SSL_CONTEXT.load_cert_chain( CERTFILE, KEYFILE )
+SSL_CONTEXT.set_alpn_protocols( [ 'http/1.1' ] )
 
 # HTTP Server class to handle IPv6
 class HTTPServer( ThreadingHTTPServer ) :
 	address_family = socket.AF_INET6
+	# Share the port between the worker processes
+	allow_reuse_port = args.workers > 1
 
 # HTTPS Server class to handle IPv6
 class HTTPSServer( ThreadingHTTPSServer ) :
 	address_family = socket.AF_INET6
+	# Share the port between the worker processes
+	allow_reuse_port = args.workers > 1
+	# Use the shared TLS context
+	def _create_context( self ) :
+		return SSL_CONTEXT
+	# Accept a connection and time the TLS handshake
+	def get_request( self ) :
+		start_time = time.perf_counter()
+		request = super().get_request()
+		METRICS.handshake( time.perf_counter() - start_time )
+		return request
 
 # HTTP request handler class to send a simple web page
 class HTTPRequestHandler( SimpleHTTPRequestHandler ) :
+	# Persistent connections (pipelined requests are read from the input buffer)
+	protocol_version = 'HTTP/1.1'
+	# Idle time before closing a persistent connection
+	timeout = args.keepalive_timeout
 	# Handle GET request
 	def do_GET( self ) :
 		# Get server IP address
-		server_external_ip_address = re.search( r'Host: (\[)?(.*)(?(1)\])', self.headers.as_string() ).group( 2 )
 		server_ip_address = CLEANUP_ADDRESS( self.connection.getsockname()[0] )
-		if server_ip_address != server_external_ip_address :
-			server_ip_address = f'{server_external_ip_address} ({server_ip_address})'
+		server_external_ip_address = get_host( self.headers.get( 'Host' ), server_ip_address )
+		# Send the metrics
+		if self.path == METRICS_PATH : return self.send( HTTPStatus.OK, METRICS.response() )
+		# Serve the files of the root directory
+		if ROOT : return self.send_file()
+		# Redirect if necessary
+		if self.path != '/' : return self.send( HTTPStatus.MOVED_PERMANENTLY, b'Location: /\r\nContent-Length: 0\r\n\r\n' )
 		# Get client IP address
-		self.client_ip_address = CLEANUP_ADDRESS( self.client_address[0] )
+		client_ip_address = CLEANUP_ADDRESS( self.client_address[0] )
 		# Get Web protocol
-		self.web_protocol = PROTOCOL[ self.server.server_port ]
-		# Redirect if necessary
-		if self.path != '/' :
-			self.send_response( HTTPStatus.MOVED_PERMANENTLY )
-			self.send_header( 'Location', '/' )
-			self.end_headers()
-			return None
+		web_protocol = PROTOCOL[ self.server.server_port ]
+		# Get the web page from the cache
+		encoding = get_encoding( self.headers.get( 'Accept-Encoding', '' ) )
+		response, self.compression_ratio = RESPONSE_CACHE.get( ( server_external_ip_address, server_ip_address, web_protocol, client_ip_address, encoding ), build_page )
 		# Send the web page
-		self.send_response( HTTPStatus.OK )
-		self.send_header( 'Content-type', 'text/html' )
-		self.end_headers()
-		self.wfile.write( bytes( WEBPAGE.format( server_ip_address, self.web_protocol, self.client_ip_address ), 'utf-8' ) )
-	# Define the console log messages
-	def log_message( self, format, *args ) :
-		sys.stderr.write( f'[ {self.log_date_time_string()} ] - Connexion from {self.client_ip_address} - ( {self.web_protocol} )\n' )
+		self.send( HTTPStatus.OK, response )
+	# Handle HEAD request (headers of the GET response, without the body)
+	def do_HEAD( self ) :
+		self.do_GET()
+	# Send a file of the root directory
+	def send_file( self ) :
+		# Prepare the file response
+		code, response, file, file_stat, offset, length, self.compression_ratio = prepare_file( self.path, self.headers, get_encoding( self.headers.get( 'Accept-Encoding', '' ) ) )
+		# Send the headers and a small file in one write
+		content = get_small_file( file, file_stat ) if length else b''
+		if content is not None : return self.send( code, response + content[ offset : offset + length ] )
+		# Send a large file with sendfile (chunked reads with TLS)
+		self.send( code, response )
+		if self.command == 'HEAD' : return
+		with open( file, 'rb' ) as f : self.response_size += self.connection.sendfile( f, offset, length )
+	# Send a response in one write (only the headers to a HEAD request)
+	def send( self, code, response ) :
+		response = self.response_status( code ) + response
+		if self.command == 'HEAD' : response = response[ : response.index( b'\r\n\r\n' ) + 4 ]
+		self.wfile.write( response )
+		self.log_request( code, len( response ) )
+	# Build the status line and the common headers
+	def response_status( self, code ) :
+		# Close the connection after the maximum number of requests
+		if self.requests >= args.max_requests : self.close_connection = True
+		return bytes( f'{self.protocol_version} {code.value} {code.phrase}\r\n'
+			f'Server: {self.version_string()}\r\nDate: {self.date_time_string()}\r\n'
+			f'Connection: {'close' if self.close_connection else 'keep-alive'}\r\n', 'latin-1' )
+	# Handle one request, and queue its access log record
+	def handle_one_request( self ) :
+		self.requests += 1
+		self.start_time = time.perf_counter()
+		self.response_code = None
+		self.compression_ratio = None
+		super().handle_one_request()
+		if self.response_code is None : return
+		latency = time.perf_counter() - self.start_time
+		ACCESS_LOG.log( CLEANUP_ADDRESS( self.client_address[0] ), CLEANUP_ADDRESS( self.connection.getsockname()[0] ),
+			PROTOCOL.get( self.server.server_port ), getattr( self, 'command', '-' ), getattr( self, 'path', '-' ), self.response_code, self.response_size, latency, self.compression_ratio )
+		METRICS.request( PROTOCOL.get( self.server.server_port ), self.client_address[0], latency )
+	# Count the open connections, and the requests of each connection
+	def setup( self ) :
+		super().setup()
+		self.requests = 0
+		METRICS.connection( PROTOCOL.get( self.server.server_port ), 1 )
+	def finish( self ) :
+		try : super().finish()
+		finally : METRICS.connection( PROTOCOL.get( self.server.server_port ), -1 )
+	# Save the response status for the access log
+	def log_request( self, code='-', size='-' ) :
+		self.response_code = code
+		self.response_size = size if isinstance( size, int ) else 0
+	# Do not log the idle persistent connections closed by the timeout
+	def log_error( self, format, *args ) :
+		if not format.startswith( 'Request timed out' ) : super().log_error( format, *args )
+
+# Asyncio HTTP server to serve HTTP and HTTPS from one event loop
+class AsyncHTTPServer :
+	# HTTP version of the responses, whatever the version of the requests (HTTP/1.0 or HTTP/1.1)
+	protocol_version = HTTPRequestHandler.protocol_version
+	# Server name in the response headers
+	server_version = f'{HTTPRequestHandler.server_version} {HTTPRequestHandler.sys_version}'
+	# Initialisation
+	def __init__( self, max_connections ) :
+		# Limit the number of concurrent connections
+		self.connections = asyncio.Semaphore( max_connections )
+	# Handle a client connection
+	async def handle( self, reader, writer ) :
+		# Get Web protocol
+		web_protocol = PROTOCOL[ writer.get_extra_info( 'sockname' )[1] ]
+		async with self.connections :
+			METRICS.connection( web_protocol, 1 )
+			try :
+				# Do and time the TLS handshake
+				if web_protocol == 'HTTPS' :
+					start_time = time.perf_counter()
+					await writer.start_tls( SSL_CONTEXT )
+					METRICS.handshake( time.perf_counter() - start_time )
+				# Serve the requests until the connection is closed
+				await self.handle_requests( reader, writer, web_protocol )
+			# Connection error
+			except ( OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError ) : pass
+			# Close the connection
+			finally :
+				writer.close()
+				METRICS.connection( web_protocol, -1 )
+	# Handle the requests of a persistent connection
+	async def handle_requests( self, reader, writer, web_protocol ) :
+		# Get server and client IP addresses
+		server_ip_address = CLEANUP_ADDRESS( writer.get_extra_info( 'sockname' )[0] )
+		client_ip_address = CLEANUP_ADDRESS( writer.get_extra_info( 'peername' )[0] )
+		for requests in range( 1, args.max_requests + 1 ) :
+			# Wait for the next request (pipelined requests are read from the stream buffer)
+			try : request = await asyncio.wait_for( reader.readuntil( b'\r\n\r\n' ), args.keepalive_timeout )
+			except TimeoutError : return
+			start_time = time.perf_counter()
+			# Parse the request line and the headers
+			request_line, *header_lines = request.decode( 'latin-1' ).split( '\r\n' )
+			headers = dict( ( name.strip().lower(), value.strip() ) for name, _, value in ( line.partition( ':' ) for line in header_lines if line ) )
+			# Check the request line, the HTTP version and the request body size
+			method = path = '-'
+			try :
+				method, path, version = request_line.split()
+				content_length = int( headers.get( 'content-length', 0 ) )
+				if content_length < 0 : raise ValueError
+				error = None if version in ( 'HTTP/1.0', 'HTTP/1.1' ) else HTTPStatus.HTTP_VERSION_NOT_SUPPORTED
+			except ValueError : error = HTTPStatus.BAD_REQUEST
+			# Skip the request body
+			if not error and content_length : await reader.readexactly( content_length )
+			# Persistent connection by default with HTTP/1.1 (closed after an invalid request)
+			connection = headers.get( 'connection', '' ).lower()
+			keep_alive = not error and ( connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive' )
+			# Close the connection after the maximum number of requests
+			if requests == args.max_requests : keep_alive = False
+			# No compression by default
+			ratio = None
+			# Only the GET and HEAD methods are supported (HEAD sends the headers of the GET response)
+			head = method == 'HEAD'
+			# Invalid request
+			if error :
+				code, size = await self.send( writer, error, keep_alive )
+			elif method != 'GET' and not head :
+				code, size = await self.send( writer, HTTPStatus.NOT_IMPLEMENTED, keep_alive )
+			# Send the metrics
+			elif path == METRICS_PATH :
+				code, size = await self.send( writer, HTTPStatus.OK, keep_alive, METRICS.response(), head )
+			# Serve the files of the root directory
+			elif ROOT :
+				code, size, ratio = await self.send_file( writer, path, headers, keep_alive, head )
+			# Redirect if necessary
+			elif path != '/' :
+				code, size = await self.send( writer, HTTPStatus.MOVED_PERMANENTLY, keep_alive, b'Location: /\r\nContent-Length: 0\r\n\r\n' )
+			# Send the web page
+			else :
+				host = get_host( headers.get( 'host' ), server_ip_address )
+				encoding = get_encoding( headers.get( 'accept-encoding', '' ) )
+				response, ratio = RESPONSE_CACHE.get( ( host, server_ip_address, web_protocol, client_ip_address, encoding ), build_page )
+				code, size = await self.send( writer, HTTPStatus.OK, keep_alive, response, head )
+			# Queue the access log record and update the metrics
+			latency = time.perf_counter() - start_time
+			ACCESS_LOG.log( client_ip_address, server_ip_address, web_protocol, method, path, code, size, latency, ratio )
+			METRICS.request( web_protocol, client_ip_address, latency )
+			# Close the connection if necessary
+			if not keep_alive : return
+	# Send a response (only the headers to a HEAD request), return the status code and the number of bytes sent
+	async def send( self, writer, code, keep_alive, response=b'Content-Length: 0\r\n\r\n', head=False ) :
+		response = bytes( f'{self.protocol_version} {code.value} {code.phrase}\r\n'
+			f'Server: {self.server_version}\r\nDate: {formatdate( usegmt=True )}\r\n'
+			f'Connection: {'keep-alive' if keep_alive else 'close'}\r\n', 'latin-1' ) + response
+		if head : response = response[ : response.index( b'\r\n\r\n' ) + 4 ]
+		writer.write( response )
+		await writer.drain()
+		return code, len( response )
+	# Send a file of the root directory, return the status code, the number of bytes sent and the compression ratio
+	async def send_file( self, writer, path, headers, keep_alive, head ) :
+		# Prepare the file response
+		code, response, file, file_stat, offset, length, ratio = prepare_file( path, headers, get_encoding( headers.get( 'accept-encoding', '' ) ) )
+		# Send the headers and a small file
+		content = get_small_file( file, file_stat ) if length else b''
+		if content is not None :
+			return *await self.send( writer, code, keep_alive, response + content[ offset : offset + length ], head ), ratio
+		# Send a large file with sendfile (chunked reads with TLS)
+		code, size = await self.send( writer, code, keep_alive, response )
+		if head : return code, size, ratio
+		with open( file, 'rb' ) as f : size += await asyncio.get_running_loop().sendfile( writer.transport, f, offset, length )
+		return code, size, ratio
+
+# Run the threaded servers
+def run_threads() :
+	# Create the HTTP server
+	httpd = HTTPServer( ('::', 80), HTTPRequestHandler )
+	# Create the HTTPS server
+	httpsd = HTTPSServer( ('::', 443), HTTPRequestHandler, certfile=CERTFILE, keyfile=KEYFILE )
+	# Start the HTTP server
+	threading.Thread( target=httpd.serve_forever, daemon=True ).start()
+	# Start the HTTPS server
+	threading.Thread( target=httpsd.serve_forever, daemon=True ).start()
+	# Wait for a signal (such as KeybordInterrupt)
+	signal.pause()
 
-# Create the HTTP server
-httpd = HTTPServer( ('::', 80), HTTPRequestHandler )
+# Run the asyncio servers
+async def run_asyncio() :
+	# Create the HTTP and HTTPS servers on the same event loop (dual-stack sockets, TLS handshake done by the handler)
+	server = AsyncHTTPServer( args.max_connections )
+	httpd = await asyncio.start_server( server.handle, sock=socket.create_server( ('::', 80),
+		family=socket.AF_INET6, dualstack_ipv6=True, reuse_port=args.workers > 1 ) )
+	httpsd = await asyncio.start_server( server.handle, sock=socket.create_server( ('::', 443),
+		family=socket.AF_INET6, dualstack_ipv6=True, reuse_port=args.workers > 1 ) )
+	# Serve forever
+	async with httpd, httpsd :
+		await asyncio.gather( httpd.serve_forever(), httpsd.serve_forever() )
 
-# Create the HTTPS server
-httpsd = HTTPSServer( ('::', 443), HTTPRequestHandler, certfile=CERTFILE.name, keyfile=KEYFILE.name )
+# Run the servers with the selected engine
+def run_server() :
+	# Start the access log writer (in each worker process)
+	ACCESS_LOG.start()
+	try :
+		if args.engine == 'asyncio' : asyncio.run( run_asyncio() )
+		else : run_threads()
+	# Write the queued access log records
+	finally : ACCESS_LOG.stop()
+
+# Start a worker process
+def start_worker() :
+	# Fork the application
+	pid = os.fork()
+	# Parent process
+	if pid : return pid
+	# Ctrl+C is handled by the parent process, which stops the workers with SIGTERM
+	signal.signal( signal.SIGINT, signal.SIG_IGN )
+	signal.signal( signal.SIGCHLD, signal.SIG_DFL )
+	signal.signal( signal.SIGTERM, lambda signum, frame : sys.exit() )
+	# Run the server until stopped
+	try : run_server()
+	# Stopped by the parent process
+	except SystemExit :
+		print( f'Worker {os.getpid()} - Response cache : {RESPONSE_CACHE.stats()}' )
+		os._exit( 0 )
+	# Crash
+	except BaseException : traceback.print_exc()
+	# Exit without running the parent process cleanup
+	os._exit( 1 )
+
+# Run the worker processes, and restart them if they crash
+def run_workers( number ) :
+	# Worker process ID and start time
+	workers = {}
+	# Restart the workers that exited
+	def restart_workers( signum, frame ) :
+		while workers :
+			pid, status = os.waitpid( -1, os.WNOHANG )
+			if not pid : return
+			# Stop if the worker crashed at startup (port in use, ...)
+			if time.monotonic() - workers.pop( pid ) < 1 :
+				raise RuntimeError( f'Worker {pid} failed to start' )
+			print( f'-> Worker {pid} exited with status {os.waitstatus_to_exitcode( status )}, restarting...' )
+			workers[ start_worker() ] = time.monotonic()
+	# Start the workers
+	for _ in range( number ) : workers[ start_worker() ] = time.monotonic()
+	signal.signal( signal.SIGCHLD, restart_workers )
+	try :
+		# Wait for a signal (such as KeybordInterrupt)
+		while True : signal.pause()
+	# A worker failed to start
+	except RuntimeError as error : print( f'\n-> {error}...' )
+	finally :
+		# Stop the workers
+		signal.signal( signal.SIGCHLD, signal.SIG_DFL )
+		for pid in workers : os.kill( pid, signal.SIGTERM )
+		for pid in workers : os.waitpid( pid, 0 )
+
+# Benchmark the full and resumed TLS handshakes on a local HTTPS server
+def bench_tls( duration=3 ) :
+	# Request handler sending an empty response
+	class EmptyRequestHandler( socketserver.StreamRequestHandler ) :
+		def handle( self ) :
+			self.rfile.readline()
+			self.wfile.write( b'HTTP/1.0 204 No Content\r\n\r\n' )
+	# Start an HTTPS server on a free local port
+	httpsd = HTTPSServer( ('::1', 0), EmptyRequestHandler, certfile=CERTFILE, keyfile=KEYFILE )
+	threading.Thread( target=httpsd.serve_forever, daemon=True ).start()
+	# Client TLS context accepting the self-signed certificate
+	context = ssl.create_default_context()
+	context.check_hostname = False
+	context.verify_mode = ssl.CERT_NONE
+	# Do one handshake and one request (the session tickets are received with the response)
+	def handshake( session=None ) :
+		with context.wrap_socket( socket.create_connection( ('::1', httpsd.server_port) ), session=session ) as tls :
+			tls.sendall( b'GET / HTTP/1.0\r\n\r\n' )
+			tls.recv( 1024 )
+			return tls.session, tls.session_reused
+	# Benchmark the full handshakes, then the handshakes resumed with a session ticket
+	print( f'\nTLS handshakes ( {args.key_type.upper()} key ) :' )
+	for name, session in ( ( 'Full', None ), ( 'Resumed', handshake()[0] ) ) :
+		count = resumed = 0
+		end = time.monotonic() + duration
+		while time.monotonic() < end :
+			resumed += handshake( session )[1]
+			count += 1
+		print( f'	{name:8} : {count / duration:8.1f} handshakes/s ( {100 * resumed / count:.0f} % resumed )' )
+	httpsd.shutdown()
+
+# Benchmark the TLS handshakes and exit
+if args.bench_tls :
+	bench_tls()
+	exit()
 
 # Print banner
 print( '\n~~~ IUT RT Auxerre - Web Server    ~~~~' )
 print( 'Press Ctrl+C to stop the application...\n' )
+if not METRICS_PATH : print( f'-> Metrics disabled with {args.workers} worker processes (/metrics needs a single process)\n' )
 
 # Handle exceptions such as Ctrl+C
 try :
-	# Start the HTTP server
-	threading.Thread( target=httpd.serve_forever, daemon=True ).start()
-	# Start the HTTPS server
-	threading.Thread( target=httpsd.serve_forever, daemon=True ).start()
-	# Wait for a signal (such as KeybordInterrupt)
-	signal.pause()
+	# Start the worker processes, or the servers in this process
+	if args.workers > 1 : run_workers( args.workers )
+	else : run_server()
 # Catch exceptions
 except : pass
 
-# Remove the temporary files
-CERTFILE.close()
-KEYFILE.close()
+# Print the response cache statistics
+if args.workers == 1 : print( f'\nResponse cache : {RESPONSE_CACHE.stats()}' )
+if args.workers == 1 and ROOT : print( f'File cache : {FILE_CACHE.stats()}' )
+if args.workers == 1 and COMPRESSORS : print( f'Compression cache : {COMPRESSION_CACHE.stats()}' )